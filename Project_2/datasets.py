@@ -0,0 +1,172 @@
+'''datasets.py
+Loads the datasets in data/ into a cache of .npy arrays that later loads memory-map
+CS443: Computational Neuroscience
+YOUR NAMES HERE
+Project 2: Content Addressable Memory
+'''
+import os
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+
+# Size of each digit image in digits.txt
+DIGITS_WIDTH = 9
+DIGITS_HEIGHT = 7
+MNIST_WIDTH = 28
+MNIST_HEIGHT = 28
+
+
+def cached_array(name, sources, build, cache_dir=CACHE_DIR, mmap_mode='r'):
+    '''Loads the cached array `name`, building and saving it first if it is not cached yet or if
+    one of its source files changed since.
+
+    Parameters:
+    -----------
+    name: str. Name of the .npy file in the cache.
+    sources: list of str. Paths of the files that the array is built from.
+    build: callable. build() returns the array.
+    cache_dir: str. Directory of the cache.
+    mmap_mode: str or None. Memory-map mode of np.load ('r' pages in only the rows that are used).
+        None reads the whole array into memory.
+
+    Returns:
+    -----------
+    ndarray (np.memmap unless `mmap_mode` is None).
+    '''
+    path = os.path.join(cache_dir, name + '.npy')
+    if not os.path.exists(path) or \
+            os.path.getmtime(path) < max(os.path.getmtime(source) for source in sources):
+        arr = build()
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first, so an interrupted build never leaves a broken cache
+        tmp_path = os.path.join(cache_dir, name + '.tmp.npy')
+        np.save(tmp_path, arr)
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def load_mat(path, key):
+    '''Reads the variable `key` of a MATLAB .mat file. Version 7.3 files are HDF5 files and need
+    the h5py package.
+
+    Parameters:
+    -----------
+    path: str. Path of the .mat file.
+    key: str. Name of the MATLAB variable.
+
+    Returns:
+    -----------
+    ndarray. The variable, with MATLAB's dimension order.
+    '''
+    from scipy import io
+    try:
+        return io.loadmat(path)[key]
+    except NotImplementedError:
+        import h5py
+        with h5py.File(path, 'r') as f:
+            # HDF5 stores MATLAB's column-major arrays with the dimensions reversed
+            return f[key][()].T
+
+
+def load_digits(cache_dir=CACHE_DIR, mmap_mode='r'):
+    '''Loads the 10 digits of data/digits.txt (one row of '0'/'1' characters per image row).
+
+    Parameters:
+    -----------
+    cache_dir, mmap_mode: See `cached_array`.
+
+    Returns:
+    -----------
+    ndarray of int8. shape=(10, DIGITS_HEIGHT*DIGITS_WIDTH). Bipolar (-1, +1) digits, ready to be
+        stored in a HopfieldNet (orig_width=DIGITS_WIDTH, orig_height=DIGITS_HEIGHT).
+    '''
+    path = os.path.join(DATA_DIR, 'digits.txt')
+
+    def build():
+        with open(path, 'rb') as f:
+            chars = f.read().replace(b'\r', b'').replace(b'\n', b'')
+        bits = np.frombuffer(chars, dtype=np.uint8) - ord('0')
+        return (2*bits.astype(np.int8) - 1).reshape(-1, DIGITS_HEIGHT*DIGITS_WIDTH)
+
+    return cached_array('digits', [path], build, cache_dir, mmap_mode)
+
+
+def _mnist_path(which_set, labels=False):
+    '''Path of the .mat file with the images (or labels) of an MNIST set.'''
+    if which_set not in ('train', 'test'):
+        raise ValueError(f'Unknown MNIST set {which_set}. Options are train, test')
+    return os.path.join(DATA_DIR, 'MNIST', f'mnist_{which_set}{"_labels" if labels else ""}.mat')
+
+
+def load_mnist_labels(which_set='test', cache_dir=CACHE_DIR, mmap_mode='r'):
+    '''Loads the labels of a whole MNIST set of data/MNIST. The labels of both sets are in the
+    repository.
+
+    Parameters:
+    -----------
+    which_set: str. 'train' or 'test'.
+    cache_dir, mmap_mode: See `cached_array`.
+
+    Returns:
+    -----------
+    ndarray of uint8. shape=(num_imgs,). Digit class of each image.
+    '''
+    path = _mnist_path(which_set, labels=True)
+
+    def build():
+        return load_mat(path, 'y').ravel().astype(np.uint8)
+
+    return cached_array(f'mnist_{which_set}_labels', [path], build, cache_dir, mmap_mode)
+
+
+def load_mnist_arrays(which_set='test', cache_dir=CACHE_DIR, mmap_mode='r'):
+    '''Loads a whole MNIST set of data/MNIST.
+
+    Only the test images are in the repository (data/MNIST/mnist_test.mat). To use the training
+    set, put mnist_train.mat (the 60000 training images, variable 'data') next to it.
+
+    Parameters:
+    -----------
+    which_set: str. 'train' or 'test'.
+    cache_dir, mmap_mode: See `cached_array`.
+
+    Returns:
+    -----------
+    ndarray of uint8. shape=(num_imgs, MNIST_HEIGHT, MNIST_WIDTH). Images (0-255).
+    ndarray of uint8. shape=(num_imgs,). Digit class of each image.
+    '''
+    data_path = _mnist_path(which_set)
+    if not os.path.exists(data_path):
+        raise FileNotFoundError(f'The MNIST {which_set} images ({data_path}) are not in the '
+                                'repository, only the test images are. The labels of every set '
+                                'can be loaded with load_mnist_labels')
+
+    def build_imgs():
+        return load_mat(data_path, 'data').reshape(-1, MNIST_HEIGHT, MNIST_WIDTH).astype(np.uint8)
+
+    imgs = cached_array(f'mnist_{which_set}', [data_path], build_imgs, cache_dir, mmap_mode)
+    return imgs, load_mnist_labels(which_set, cache_dir, mmap_mode)
+
+
+def load_mnist(which_set='test', num_exemplars=None, num_classes=10, cache_dir=CACHE_DIR):
+    '''Loads the first `num_exemplars` images of each of the first `num_classes` MNIST digit
+    classes (like load_mnist.m). Only the selected images are read from the cache.
+
+    Parameters:
+    -----------
+    which_set: str. 'train' or 'test' (see `load_mnist_arrays`).
+    num_exemplars: int or None. Number of images of each class. None for all of them.
+    num_classes: int. Load the digits 0, 1, ..., `num_classes`-1.
+    cache_dir: str. Directory of the cache.
+
+    Returns:
+    -----------
+    ndarray of uint8. shape=(num_exemplars*num_classes, MNIST_HEIGHT, MNIST_WIDTH). Images, class
+        by class. Pass them to `preprocessing.img2binaryvectors` to store them in a HopfieldNet.
+    ndarray of uint8. shape=(num_exemplars*num_classes,). Digit class of each image.
+    '''
+    imgs, labels = load_mnist_arrays(which_set, cache_dir)
+    labels = np.asarray(labels)
+    inds = np.concatenate([np.flatnonzero(labels == c)[:num_exemplars] for c in range(num_classes)])
+    return np.asarray(imgs[inds]), labels[inds]
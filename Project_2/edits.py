@@ -26,12 +26,9 @@ n_cols = 9
 
 # Import, preprocess, and plot digits ultimately as ndarrays  
 
-# load binary digit data
-with open("data/digits.txt") as f:
-    content = f.read()
-    
-digits = np.array([int(char) for line in content.split('\n') for char in line])
-digits = np.where(digits==0, -1, digits)
+# load binary digit data (bipolar, cached as a .npy file after the first load)
+import datasets
+digits = np.asarray(datasets.load_digits())
 
 # create dataframe digits for visualization and training
 digits_vis = digits.reshape((n_digits, n_rows, n_cols))
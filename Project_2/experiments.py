@@ -0,0 +1,206 @@
+'''experiments.py
+Storage capacity and robustness experiments with the Hopfield network
+CS443: Computational Neuroscience
+YOUR NAMES HERE
+Project 2: Content Addressable Memory
+'''
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import preprocessing
+from hopfield import HopfieldNet, DenseAssociativeMemory
+
+
+def corrupt(data, noise=0.0, occlusion=0.0, rng=None, fill=0):
+    '''Makes noisy and/or occluded copies of bipolar data samples, all samples at once.
+
+    Parameters:
+    -----------
+    data: ndarray. shape=(N, M). Bipolar data samples.
+    noise: float. Proportion of the M components of each sample whose sign is flipped. Every
+        sample gets exactly round(noise*M) flips at its own random positions.
+    occlusion: float. Proportion of each sample that is lost, starting from the end of the vector
+        (i.e. the bottom of an image).
+    rng: np.random.Generator or None. Source of the random flip positions.
+    fill: number. Value given to the occluded components.
+
+    Returns:
+    -----------
+    ndarray. shape=(N, M). The corrupted samples.
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    data = np.array(data)
+    N, M = data.shape
+
+    num_flips = int(round(noise*M))
+    if num_flips > 0:
+        # The num_flips smallest of M uniform draws per row are a random subset of positions
+        flips = np.argpartition(rng.random((N, M)), num_flips - 1, axis=1)[:, :num_flips]
+        np.negative.at(data, (np.arange(N)[:, np.newaxis], flips))
+
+    num_lost = int(round(occlusion*M))
+    if num_lost > 0:
+        data[:, M - num_lost:] = fill
+    return data
+
+
+def _run_cell_group(args):
+    '''Runs every (occlusion, trial) cell for one (number of patterns, noise level) pair.
+    Top-level function so that it can be sent to worker processes.
+    '''
+    data, orig_width, orig_height, num_patterns, noise, occlusions, trials, seed, net_cls, \
+        net_kwargs, predict_kwargs = args
+    net = net_cls(data[:num_patterns], orig_width, orig_height, **net_kwargs)
+
+    errors = []
+    # With workers=1 the cells run in the caller's process: leave its global RNG as it was
+    global_state = np.random.get_state()
+    try:
+        for occlusion, trial in itertools.product(occlusions, range(trials)):
+            # Each cell gets its own RNG stream derived only from its grid position, so results
+            # do not depend on how cells are spread over workers
+            stream = np.random.SeedSequence([seed, num_patterns, round(noise*1e6),
+                                             round(occlusion*1e6), trial])
+            rng = np.random.default_rng(stream)
+            np.random.seed(stream.generate_state(1)[0])  # neuron selection in `predict`
+
+            probes = corrupt(data[:num_patterns], noise, occlusion, rng)
+            recalled = net.predict(probes, **predict_kwargs)
+            errors.append(preprocessing.recall_error(data[:num_patterns], recalled))
+    finally:
+        np.random.set_state(global_state)
+    return errors
+
+
+def recall_grid(data, orig_width, orig_height, num_patterns, noise=(0.1,), occlusion=(0.0,),
+                trials=1, seed=0, workers=None, net_kwargs=None, net_cls=HopfieldNet,
+                **predict_kwargs):
+    '''Measures recall error over a grid of
+    (number of stored patterns x flip noise level x occlusion fraction x trial).
+
+    In each cell, the first `num_patterns` samples of `data` are stored in a network, corrupted
+    with `corrupt`, and recalled. Groups of cells run in a process pool.
+
+    Parameters:
+    -----------
+    data: ndarray. shape=(N, M). Bipolar data samples to store.
+    orig_width, orig_height: ints. Original image size (see HopfieldNet).
+    num_patterns: iterable of ints. Numbers of patterns stored in the network (each <= N).
+    noise: iterable of floats. Proportions of flipped components.
+    occlusion: iterable of floats. Proportions of each pattern that is lost.
+    trials: int. Number of trials with different corruptions per grid cell.
+    seed: int. Seed of the experiment. The same seed gives the same table for any `workers`.
+    workers: int or None. Number of worker processes. None uses all the CPUs, 1 runs everything
+        in the current process.
+    net_kwargs: dict or None. Keyword arguments passed to the network constructor.
+    net_cls: class. The network, HopfieldNet or DenseAssociativeMemory.
+    predict_kwargs: Keyword arguments passed to the `predict` method of the network. By default
+        the probes of a HopfieldNet cell are recalled together (batch=True).
+
+    Returns:
+    -----------
+    dict of ndarrays. One row per grid cell, with the columns
+        'num_patterns', 'noise', 'occlusion', 'trial', 'error'.
+        (pandas.DataFrame(table) turns it into a data frame.)
+    '''
+    num_patterns, noise, occlusion = list(num_patterns), list(noise), list(occlusion)
+    if issubclass(net_cls, HopfieldNet):
+        predict_kwargs.setdefault('batch', True)
+    data = np.asarray(data)
+
+    groups = list(itertools.product(num_patterns, noise))
+    tasks = [(data, orig_width, orig_height, n, p, occlusion, trials, seed, net_cls,
+              net_kwargs or {}, predict_kwargs) for n, p in groups]
+    if workers == 1:
+        errors = list(map(_run_cell_group, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            errors = list(pool.map(_run_cell_group, tasks))
+
+    cells = [(n, p, o, t) for (n, p) in groups for o, t in itertools.product(occlusion, range(trials))]
+    columns = np.array(cells, dtype=float).T
+    return {'num_patterns': columns[0].astype(int),
+            'noise': columns[1],
+            'occlusion': columns[2],
+            'trial': columns[3].astype(int),
+            'error': np.concatenate(errors)}
+
+
+def sparse_tradeoff(data, orig_width, orig_height, configs, num_patterns, noise=(0.1,),
+                    occlusion=(0.0,), trials=1, seed=0, workers=None, **predict_kwargs):
+    '''Compares the recall error of diluted (sparse) networks against the dense network on the
+    same corrupted probes (`recall_grid` with the same `seed` for every network).
+
+    Parameters:
+    -----------
+    data, orig_width, orig_height, num_patterns, noise, occlusion, trials, seed, workers:
+        See `recall_grid`.
+    configs: list of dicts. HopfieldNet keyword arguments of each network to compare. Example:
+        [{'storage': 'dense'}, {'storage': 'sparse', 'radius': 3}, {'storage': 'sparse', 'threshold': 0.5}]
+
+    Returns:
+    -----------
+    dict of ndarrays. The `recall_grid` columns for every network, plus
+        'config': index of the network in `configs`,
+        'connectivity': proportion of the M*(M-1) possible connections that the network keeps
+            (measured with all max(num_patterns) patterns stored).
+    '''
+    num_patterns = list(num_patterns)
+    M = data.shape[1]
+    tables = []
+    for c, net_kwargs in enumerate(configs):
+        table = recall_grid(data, orig_width, orig_height, num_patterns, noise, occlusion, trials,
+                            seed, workers, net_kwargs, **predict_kwargs)
+
+        if net_kwargs.get('storage') == 'sparse':
+            net = HopfieldNet(data[:max(num_patterns)], orig_width, orig_height, **net_kwargs)
+            connectivity = net.wts.nnz / (M*(M - 1))
+        else:
+            connectivity = 1.0
+
+        table['config'] = np.full(len(table['error']), c)
+        table['connectivity'] = np.full(len(table['error']), connectivity)
+        tables.append(table)
+    return {key: np.concatenate([table[key] for table in tables]) for key in tables[0]}
+
+
+def capacity_comparison(data, orig_width, orig_height, num_patterns, models=None, noise=(0.1,),
+                        occlusion=(0.0,), trials=1, seed=0, workers=None):
+    '''The storage capacity experiment of Task 4b (recall error as more and more patterns are
+    stored) for the Hebbian HopfieldNet and dense associative memories, on the same corrupted
+    probes (`recall_grid` with the same `seed` for every model).
+
+    Parameters:
+    -----------
+    data, orig_width, orig_height, num_patterns, noise, occlusion, trials, seed, workers:
+        See `recall_grid`.
+    models: list of (class, constructor kwargs, predict kwargs) or None. The networks to compare.
+        None compares
+            [(HopfieldNet, {}, {}),
+             (DenseAssociativeMemory, {'energy': 'softmax', 'beta': 1.0}, {}),
+             (DenseAssociativeMemory, {'energy': 'polynomial', 'degree': 3}, {})]
+
+    Returns:
+    -----------
+    dict of ndarrays. The `recall_grid` columns for every model, plus
+        'model': index of the model in `models`,
+        'model_name': class name and constructor kwargs of the model, e.g.
+            "DenseAssociativeMemory(energy='softmax', beta=1.0)".
+    '''
+    if models is None:
+        models = [(HopfieldNet, {}, {}),
+                  (DenseAssociativeMemory, {'energy': 'softmax', 'beta': 1.0}, {}),
+                  (DenseAssociativeMemory, {'energy': 'polynomial', 'degree': 3}, {})]
+    tables = []
+    for m, (net_cls, net_kwargs, predict_kwargs) in enumerate(models):
+        table = recall_grid(data, orig_width, orig_height, num_patterns, noise, occlusion, trials,
+                            seed, workers, net_kwargs, net_cls, **predict_kwargs)
+
+        args = ', '.join(f'{key}={value!r}' for key, value in net_kwargs.items())
+        table['model'] = np.full(len(table['error']), m)
+        table['model_name'] = np.full(len(table['error']), f'{net_cls.__name__}({args})')
+        tables.append(table)
+    return {key: np.concatenate([table[key] for table in tables]) for key in tables[0]}
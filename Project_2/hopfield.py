@@ -9,14 +9,570 @@ import matplotlib.pyplot as plt
 from IPython.display import display, clear_output
 import random 
 import math 
+import os
+import json
+import time
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
 import preprocessing
 
 
+def hebbian_wts(data, dtype=np.float32, samp_chunk=256, tile_sz=2048, out=None):
+    '''Builds the Hebbian weight matrix Xᵀ·X / N (with zeros on the diagonal) in blocks.
+
+    The samples are cast to the float `dtype` one chunk of `samp_chunk` samples at a time so that
+    the outer products go through BLAS (integer matmul does not), and each chunk is accumulated
+    into the output one `tile_sz` x `tile_sz` tile at a time. Only the upper triangle of tiles is
+    computed and then mirrored. Peak memory stays close to one copy of the final matrix.
+
+    Parameters:
+    -----------
+    data: ndarray. shape=(N, M). Bipolar data samples (any numeric dtype, may be a memmap).
+    dtype: numpy float dtype. Data type of the weights.
+    samp_chunk: int. Number of samples cast and accumulated at a time.
+    tile_sz: int. Side length of the output tiles.
+    out: None, ndarray, or str. Where to write the weights.
+        None: allocate a new array.
+        ndarray: caller-supplied array (or np.memmap) with shape=(M, M).
+        str: path of a .npy file that is created and memory-mapped (see np.lib.format.open_memmap).
+
+    Returns:
+    -----------
+    ndarray. shape=(M, M). The weight matrix (`out` when it was given).
+    '''
+    N, M = data.shape
+    if out is None:
+        out = np.zeros((M, M), dtype=dtype)
+    elif isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=(M, M))
+    else:
+        if out.shape != (M, M):
+            raise ValueError(f'out has shape {out.shape}, expected {(M, M)}')
+        out[...] = 0
+
+    starts = range(0, M, tile_sz)
+    for n in range(0, N, samp_chunk):
+        chunk = np.asarray(data[n:n+samp_chunk], dtype=out.dtype)
+        for r in starts:
+            for c in starts:
+                if c >= r:
+                    out[r:r+tile_sz, c:c+tile_sz] += chunk[:, r:r+tile_sz].T @ chunk[:, c:c+tile_sz]
+
+    for r in starts:
+        for c in starts:
+            if c > r:
+                out[r:r+tile_sz, c:c+tile_sz] /= N
+                out[c:c+tile_sz, r:r+tile_sz] = out[r:r+tile_sz, c:c+tile_sz].T
+            elif c == r:
+                tile = out[r:r+tile_sz, c:c+tile_sz]
+                tile /= N
+                np.fill_diagonal(tile, 0)
+    return out
+
+
+def sparse_hebbian_wts(data, orig_width, orig_height, radius=None, threshold=None,
+                       dtype=np.float32, tile_sz=2048):
+    '''Builds a diluted (sparsely connected) version of the Hebbian weights as a CSR sparse matrix,
+    without ever holding the dense MxM matrix.
+
+    A connection w_ij = (1/N) Σ_n x_ni x_nj is kept when neurons i and j are within `radius`
+    pixels of each other in the original image and/or when |w_ij| >= `threshold`.
+
+    Parameters:
+    -----------
+    data: ndarray. shape=(N, M). Bipolar data samples. M = orig_width*orig_height.
+    orig_width, orig_height: ints. Original size of each image. Component i of a sample is the
+        pixel at row i // orig_width, column i % orig_width.
+    radius: float or None. Keep only the connections between pixels at most `radius` apart
+        (Euclidean distance). Costs O(N*M*radius^2).
+    threshold: float or None. Keep only the connections with magnitude >= `threshold`.
+        Without `radius`, the weights are computed one block of `tile_sz` rows at a time.
+    dtype: numpy float dtype. Data type of the weights.
+
+    Returns:
+    -----------
+    scipy.sparse.csr_matrix. shape=(M, M). Symmetric weights with no self-connections.
+    '''
+    from scipy import sparse
+
+    if radius is None and threshold is None:
+        raise ValueError('Sparse weights need a neighborhood radius and/or a magnitude threshold')
+    N, M = data.shape
+    data = np.asarray(data, dtype=dtype)
+    rows, cols, vals = [], [], []
+
+    if radius is not None:
+        r = int(np.floor(radius))
+        y, x = np.divmod(np.arange(M), orig_width)
+        for dy in range(-r, r + 1):
+            for dx in range(-r, r + 1):
+                if (dy == 0 and dx == 0) or dy**2 + dx**2 > radius**2:
+                    continue
+                valid = (y + dy >= 0) & (y + dy < orig_height) & (x + dx >= 0) & (x + dx < orig_width)
+                i = np.flatnonzero(valid)
+                j = i + dy*orig_width + dx
+                rows.append(i)
+                cols.append(j)
+                vals.append(np.sum(data[:, i] * data[:, j], axis=0) / N)
+    else:
+        for r in range(0, M, tile_sz):
+            block = data[:, r:r+tile_sz].T @ data / N
+            block[np.arange(block.shape[0]), np.arange(r, r + block.shape[0])] = 0
+            i, j = np.nonzero(np.abs(block) >= threshold)
+            rows.append(i + r)
+            cols.append(j)
+            vals.append(block[i, j])
+
+    rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+    if radius is not None and threshold is not None:
+        keep = np.abs(vals) >= threshold
+        rows, cols, vals = rows[keep], cols[keep], vals[keep]
+    return sparse.csr_matrix((vals.astype(dtype), (rows, cols)), shape=(M, M))
+
+
+class DynamicsRecorder():
+    '''Records snapshots of the network state during recall so that the dynamics can be watched
+    after the solve instead of being plotted on every time step.
+
+    Snapshots go into a preallocated ring buffer: recording a frame only costs an array copy, and
+    once the buffer is full the oldest frames are overwritten.
+    '''
+    def __init__(self, num_neurons, capacity=500, stride=1, on_flip=False, dtype=np.int8):
+        '''DynamicsRecorder constructor
+
+        Parameters:
+        -----------
+        num_neurons: int. Number of neurons in the network.
+        capacity: int. Maximum number of frames kept.
+        stride: int. Record every `stride`-th time step (the initial state is always recorded).
+        on_flip: boolean. Only record the time steps in which at least one neuron flipped.
+        dtype: numpy dtype. Data type of the recorded states (bipolar states fit in int8).
+        '''
+        self.capacity = capacity
+        self.stride = stride
+        self.on_flip = on_flip
+        self.states = np.zeros((capacity, num_neurons), dtype=dtype)
+        self.energy = np.zeros(capacity)
+        self.time = np.zeros(capacity)
+        self.step = np.zeros(capacity, dtype=int)
+        self.sample = np.zeros(capacity, dtype=int)
+        self.reset()
+
+    def reset(self):
+        '''Forgets all the recorded frames.'''
+        self.num_recorded = 0
+        self.start_time = time.perf_counter()
+
+    def __call__(self, step, samples, netAct, energy, num_flips):
+        '''Records the states of `samples` at time step `step` (called by `HopfieldNet.predict`).
+
+        Parameters:
+        -----------
+        step: int. Time step (0 is the initial state).
+        samples: ndarray of ints. shape=(n,). Index of each state in the data given to `predict`.
+        netAct: ndarray. shape=(n, num_neurons). Current states.
+        energy: ndarray. shape=(n,). Current energies.
+        num_flips: ndarray of ints. shape=(n,). Number of neurons that flipped on this time step.
+        '''
+        if step > 0:
+            if step % self.stride != 0:
+                return
+            if self.on_flip:
+                flipped = num_flips > 0
+                samples, netAct, energy = samples[flipped], netAct[flipped], energy[flipped]
+        n = min(len(samples), self.capacity)
+        if n == 0:
+            return
+
+        # With more samples than the capacity only the last n are kept, in the slots that the
+        # counter gives them, so that `frames` stays oldest first
+        pos = (self.num_recorded + len(samples) - n + np.arange(n)) % self.capacity
+        self.states[pos] = netAct[-n:]
+        self.energy[pos] = energy[-n:]
+        self.sample[pos] = samples[-n:]
+        self.step[pos] = step
+        self.time[pos] = time.perf_counter() - self.start_time
+        self.num_recorded += len(samples)
+
+    def frames(self, sample=None):
+        '''Indices of the recorded frames in the ring buffer, oldest first.
+
+        Parameters:
+        -----------
+        sample: int or None. Only the frames of this sample (index in the data given to `predict`).
+
+        Returns:
+        -----------
+        ndarray of ints. Use them to index `states`, `energy`, `time`, `step` and `sample`.
+        '''
+        count = min(self.num_recorded, self.capacity)
+        inds = (self.num_recorded - count + np.arange(count)) % self.capacity
+        if sample is not None:
+            inds = inds[self.sample[inds] == sample]
+        return inds
+
+    def show(self, width, height, sample=None, interval=0.1, cmap='bone'):
+        '''Plays back the recorded frames in a notebook, one updating image per frame.
+
+        Parameters:
+        -----------
+        width, height: ints. Original image size (`HopfieldNet.orig_width` and `orig_height`).
+        sample: int or None. Only play the frames of this sample.
+        interval: float. Pause between frames in seconds.
+        cmap: str. Matplotlib color scale.
+        '''
+        fig = plt.figure()
+        ax = fig.add_subplot(1, 1, 1)
+        for k in self.frames(sample):
+            ax.imshow(self.states[k].reshape(height, width), cmap=cmap)
+            ax.set_title(f"Sample {self.sample[k]}, step {self.step[k]}, Energy: {self.energy[k]:.2f}",
+                         fontsize=12)
+
+            display(fig)
+            clear_output(wait=True)
+            plt.pause(interval)
+
+    def animate(self, width, height, sample=None, interval=100, cmap='bone'):
+        '''Makes a matplotlib animation of the recorded frames.
+
+        Parameters:
+        -----------
+        width, height: ints. Original image size.
+        sample: int or None. Only animate the frames of this sample.
+        interval: int. Delay between frames in milliseconds.
+        cmap: str. Matplotlib color scale.
+
+        Returns:
+        -----------
+        matplotlib.animation.FuncAnimation. In a notebook, `HTML(anim.to_jshtml())` shows it as a
+            widget and `anim.save('dynamics.gif', writer='pillow')` saves an animated GIF.
+        '''
+        from matplotlib import animation
+
+        frames = self.frames(sample)
+        fig = plt.figure()
+        ax = fig.add_subplot(1, 1, 1)
+        img = ax.imshow(self.states[frames[0]].reshape(height, width), cmap=cmap,
+                        vmin=self.states.min(), vmax=self.states.max())
+
+        def draw(k):
+            img.set_data(self.states[k].reshape(height, width))
+            ax.set_title(f"Sample {self.sample[k]}, step {self.step[k]}, Energy: {self.energy[k]:.2f}",
+                         fontsize=12)
+            return img,
+
+        anim = animation.FuncAnimation(fig, draw, frames=frames, interval=interval)
+        plt.close(fig)
+        return anim
+
+
+def _step_hook(recorder, on_step):
+    '''Combines a DynamicsRecorder and a per-step hook (either may be None) into one callable,
+    or None when there is nothing to call.
+    '''
+    if recorder is None or on_step is None:
+        return on_step if recorder is None else recorder
+
+    def hook(*args):
+        recorder(*args)
+        on_step(*args)
+    return hook
+
+
+# Attributes that are not sent to the workers of `HopfieldNet.predict_parallel`
+_UNSHARED_ATTRS = ('recall_stats', 'energy_hist', 'recorder', 'index', '_index_energy')
+# Network shared by the calling process, as attached to by this worker process
+_worker_net = None
+_worker_shms = []
+
+
+def _share_arrays(net):
+    '''Copies the arrays of a network (weights, patterns, ...) into shared memory blocks, once.
+
+    Parameters:
+    -----------
+    net: HopfieldNet (or any network whose state is ndarrays, scipy sparse matrices and small
+        picklable values).
+
+    Returns:
+    -----------
+    dict. Picklable description of the network: its class, its small attributes, and the name,
+        shape and dtype of the shared block of each array (see `_attach_arrays`).
+    list of SharedMemory. The blocks. The caller must close and unlink them when done.
+    '''
+    from scipy import sparse
+
+    shms = []
+
+    def share(arr):
+        arr = np.asarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        shms.append(shm)
+        np.ndarray(arr.shape, arr.dtype, buffer=shm.buf)[...] = arr
+        return shm.name, arr.shape, arr.dtype.str
+
+    spec = {'cls': type(net), 'attrs': {}, 'arrays': {}, 'csr': {}}
+    for name, value in vars(net).items():
+        if name in _UNSHARED_ATTRS:
+            continue
+        if isinstance(value, np.ndarray):
+            spec['arrays'][name] = share(value)
+        elif sparse.issparse(value):
+            value = value.tocsr()
+            blocks = [share(getattr(value, part)) for part in ('data', 'indices', 'indptr')]
+            spec['csr'][name] = (blocks, value.shape)
+        else:
+            spec['attrs'][name] = value
+    return spec, shms
+
+
+def _attach_arrays(spec):
+    '''Pool initializer of `HopfieldNet.predict_parallel`: rebuilds the network described by
+    `spec` (see `_share_arrays`) in this worker process with read-only views of the shared
+    blocks, without copying them.
+    '''
+    global _worker_net
+    from scipy import sparse
+
+    def attach(name, shape, dtype):
+        shm = shared_memory.SharedMemory(name=name)
+        _worker_shms.append(shm)
+        arr = np.ndarray(shape, dtype, buffer=shm.buf)
+        arr.flags.writeable = False
+        return arr
+
+    net = spec['cls'].__new__(spec['cls'])
+    net.__dict__.update(spec['attrs'])
+    for name, block in spec['arrays'].items():
+        setattr(net, name, attach(*block))
+    for name, (blocks, shape) in spec['csr'].items():
+        csr = tuple(attach(*block) for block in blocks)
+        setattr(net, name, sparse.csr_matrix(csr, shape=shape))
+    net.energy_hist = []
+    net.index = None
+    _worker_net = net
+
+
+def _predict_shard(args):
+    '''Recalls one shard of probes with the worker's network (see `_attach_arrays`), or with
+    `net` when it runs in the calling process. Top-level function so that it can be sent to
+    worker processes.
+    '''
+    net, shard, seed, predict_kwargs = args
+    if net is None:
+        net = _worker_net
+    # Every shard gets its own RNG stream, so the results do not depend on the number of workers.
+    # In the calling process (workers=1), its global RNG is left as it was
+    global_state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        recalled, status = net.predict(shard, return_status=True, **predict_kwargs)
+    finally:
+        np.random.set_state(global_state)
+    return recalled, status, net.recall_stats
+
+
+class PatternIndex():
+    '''Index over the patterns stored in a Hebbian Hopfield network that finds, without running
+    the dynamics, the probes that are certain to be recalled as one of the stored patterns.
+
+    For the weights W = (XᵀX - N*I)/N, a probe s that differs from pattern x_μ in d components
+    (occluded 0 components count as differences) gives every neuron i a field with
+        x_μi*h_i*N >= (M - 2d - 1) - sum_{ν≠μ} (|C_νμ| + 2d + 1) = M - N - S_μ - 2dN
+    where C_νμ = x_ν·x_μ and S_μ = sum_{ν≠μ} |C_νμ|. So whenever
+        d < r_μ = (M - N - S_μ) / (2N)
+    every neuron that is updated takes the value it has in x_μ. The schedules that run to a
+    fixed point ('sequential', 'permutation', 'synchronous', with no `max_iters` budget) then end
+    at x_μ, and the index returns x_μ for those probes right away. The 'random' schedule (or a
+    `max_iters` budget) can stop before reaching x_μ, so `HopfieldNet.predict` does not use the
+    index with them.
+
+    Distances come from the overlaps X·s (d = (M - x·s + num_zeros)/2), as one matrix product per
+    chunk of probes. With many stored patterns, bit-sampling locality-sensitive hashing (LSH) first
+    narrows each probe down to the patterns that share all the sampled bits of at least one of
+    `num_tables` hash tables, and only those distances are computed. A probe within r_μ of x_μ
+    differs from it in few bits, so it almost always lands in one of the buckets of x_μ; a miss
+    only means that the dynamics are run as usual.
+    '''
+    def __init__(self, patterns, radius=None, method='auto', num_tables=16, num_bits=16,
+                 lsh_min_patterns=4096, chunk_sz=1024, seed=0):
+        '''PatternIndex constructor
+
+        Parameters:
+        -----------
+        patterns: ndarray. shape=(N, M). Bipolar patterns stored in the network.
+        radius: None or float. Largest Hamming distance, as a proportion of M, at which a probe is
+            recalled as its closest pattern. None uses the radius r_μ of each pattern, which
+            guarantees that the dynamics would have recalled the same pattern. A float trades that
+            guarantee for more hits.
+        method: str. 'exact' computes the distance to every pattern, 'lsh' only to the LSH
+            candidates, 'auto' uses 'lsh' with at least `lsh_min_patterns` patterns.
+        num_tables: int. Number of LSH hash tables.
+        num_bits: int. Number of sampled bits per LSH table (at most 62).
+        lsh_min_patterns: int. See `method`.
+        chunk_sz: int. Number of probes (and patterns) per matrix product.
+        seed: int. Seed of the sampled LSH bits.
+        '''
+        if method == 'auto':
+            method = 'lsh' if patterns.shape[0] >= lsh_min_patterns else 'exact'
+        if method not in ('exact', 'lsh'):
+            raise ValueError(f'Unknown index method {method}. Options are exact, lsh, auto')
+
+        self.patterns = patterns
+        self.method = method
+        self.chunk_sz = chunk_sz
+        N, M = patterns.shape
+
+        # S_μ = sum of |C_νμ| over ν≠μ, one block of pattern rows at a time
+        cross = np.zeros(N)
+        for r in range(0, N, chunk_sz):
+            block = np.asarray(patterns[r:r+chunk_sz], dtype=float)
+            C = block @ np.asarray(patterns.T, dtype=float)
+            cross[r:r+chunk_sz] = np.sum(np.abs(C), axis=1) - M
+        self.guaranteed_radius = (M - N - cross) / (2*N)
+        if radius is None:
+            self.radius = self.guaranteed_radius
+        else:
+            self.radius = np.full(N, radius*M)
+
+        if method == 'lsh':
+            rng = np.random.default_rng(seed)
+            self.bits = np.array([rng.choice(M, size=min(num_bits, M, 62), replace=False)
+                                  for _ in range(num_tables)])
+            # Each table: sorted keys of the patterns and the pattern index of each sorted key
+            self.tables = []
+            for bits in self.bits:
+                keys = self._hash(patterns, bits)
+                order = np.argsort(keys, kind='stable')
+                self.tables.append((keys[order], order))
+        self.reset_stats()
+
+    def reset_stats(self):
+        '''Clears the hit statistics.'''
+        self.num_queries = 0
+        self.num_hits = 0
+        self.num_candidates = 0
+
+    def stats(self):
+        '''Hit statistics since the index was built (or `reset_stats` was called).
+
+        Returns:
+        -----------
+        dict with
+            'queries': int. Number of probes looked up.
+            'hits': int. Number of probes recalled by the index.
+            'hit_rate': float. hits / queries (NaN before the first query).
+            'candidates_per_query': float. Average number of distances computed per probe.
+        '''
+        return {'queries': self.num_queries,
+                'hits': self.num_hits,
+                'hit_rate': self.num_hits / self.num_queries if self.num_queries else np.nan,
+                'candidates_per_query': self.num_candidates / self.num_queries
+                if self.num_queries else np.nan}
+
+    @staticmethod
+    def _hash(data, bits):
+        '''Key of each row of `data`: the signs of its components `bits` packed into an int64.'''
+        powers = 1 << np.arange(len(bits), dtype=np.int64)
+        return (np.asarray(data[:, bits]) > 0).astype(np.int64) @ powers
+
+    def distances(self, data):
+        '''Hamming distance between every probe and every stored pattern (0 components of the
+        probes count as differences).
+
+        Parameters:
+        -----------
+        data: ndarray. shape=(num_test_samps, M).
+
+        Returns:
+        -----------
+        ndarray. shape=(num_test_samps, N).
+        '''
+        M = self.patterns.shape[1]
+        data = np.asarray(data, dtype=float)
+        num_zeros = np.count_nonzero(data == 0, axis=1)[:, np.newaxis]
+        return (M - data @ np.asarray(self.patterns.T, dtype=float) + num_zeros) / 2
+
+    def query(self, data):
+        '''Looks up the stored pattern that each probe is certain to be recalled as.
+
+        Parameters:
+        -----------
+        data: ndarray. shape=(num_test_samps, M). Bipolar probes (0 for unknown components).
+
+        Returns:
+        -----------
+        ndarray of ints. shape=(num_test_samps,). Index of the pattern each probe is recalled as,
+            -1 when the probe is not within the radius of any pattern (a miss).
+        ndarray. shape=(num_test_samps,). Hamming distance to that pattern (NaN for misses).
+        '''
+        data = np.atleast_2d(data)
+        num_samps = data.shape[0]
+        match = np.full(num_samps, -1)
+        dist = np.full(num_samps, np.nan)
+
+        for c in range(0, num_samps, self.chunk_sz):
+            chunk = data[c:c+self.chunk_sz]
+            if self.method == 'exact':
+                # Closest pattern of each probe among those within their radius
+                d = self.distances(chunk)
+                self.num_candidates += d.size
+                d[d >= self.radius] = np.inf
+                best = np.argmin(d, axis=1)
+                best_d = d[np.arange(d.shape[0]), best]
+                hit = np.isfinite(best_d)
+                match[c:c+self.chunk_sz][hit] = best[hit]
+                dist[c:c+self.chunk_sz][hit] = best_d[hit]
+                continue
+
+            probe, pattern = self._candidates(chunk)
+            d = self._pair_distances(chunk, probe, pattern)
+            self.num_candidates += d.size
+            within = d < self.radius[pattern]
+            probe, pattern, d = probe[within], pattern[within], d[within]
+            order = np.lexsort((d, probe))
+            probe, pattern, d = probe[order], pattern[order], d[order]
+            first = np.r_[True, probe[1:] != probe[:-1]] if probe.size else np.zeros(0, dtype=bool)
+            match[c + probe[first]] = pattern[first]
+            dist[c + probe[first]] = d[first]
+
+        self.num_queries += num_samps
+        self.num_hits += int(np.count_nonzero(match >= 0))
+        return match, dist
+
+    def _candidates(self, data):
+        '''Unique (probe, pattern) pairs that share a bucket in at least one LSH table.'''
+        probes, patterns = [], []
+        for bits, (keys, order) in zip(self.bits, self.tables):
+            probe_keys = self._hash(data, bits)
+            lo = np.searchsorted(keys, probe_keys, side='left')
+            hi = np.searchsorted(keys, probe_keys, side='right')
+            counts = hi - lo
+            probe = np.repeat(np.arange(data.shape[0]), counts)
+            # Position of each candidate in the sorted keys: lo of its probe + rank in the bucket
+            pos = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            probes.append(probe)
+            patterns.append(order[pos])
+        pairs = np.unique(np.stack([np.concatenate(probes), np.concatenate(patterns)]), axis=1)
+        return pairs[0], pairs[1]
+
+    def _pair_distances(self, data, probe, pattern):
+        '''Hamming distances of the (probe, pattern) pairs.'''
+        d = np.empty(probe.size)
+        M = self.patterns.shape[1]
+        for r in range(0, probe.size, self.chunk_sz):
+            s = np.asarray(data[probe[r:r+self.chunk_sz]], dtype=float)
+            x = np.asarray(self.patterns[pattern[r:r+self.chunk_sz]], dtype=float)
+            d[r:r+self.chunk_sz] = (M - np.sum(s*x, axis=1) + np.count_nonzero(s == 0, axis=1)) / 2
+        return d
+
+
 class HopfieldNet():
     '''A binary Hopfield Network that assumes that input components are encoded as bipolar values
     (-1 or +1).
     '''
-    def __init__(self, data, orig_width, orig_height):
+    def __init__(self, data, orig_width, orig_height, storage='auto', dtype=np.float64,
+                 radius=None, threshold=None):
         '''HopfieldNet constructor
 
         Parameters:
@@ -27,6 +583,18 @@ class HopfieldNet():
             If data are not images, this can be set to the vector length (number of features).
         orig_height : int. Original height of each image before it was flattened into a 1D vector.
             If data are not images, this can be set to 1.
+        storage: str. How the weights are stored. Options are:
+            'dense': the MxM weight matrix built by `initialize_wts`.
+            'implicit': only the NxM pattern matrix X. The dynamics use W·s = Xᵀ(X·s)/N minus the
+                self-connection term, which takes O(N*M) memory and time instead of O(M^2).
+            'sparse': diluted connectivity stored as a CSR sparse matrix. Only the weights within
+                `radius` pixels of each other and/or with magnitude >= `threshold` are kept
+                (see `sparse_hebbian_wts`). This makes full-resolution images tractable.
+            'auto': 'implicit' when only a handful of patterns are stored (N < M/2), else 'dense'.
+        dtype: numpy float dtype. Data type of the weights (and of the stored patterns).
+            np.float32 halves the memory of the weights.
+        radius: float or None. Neighborhood radius (in pixels) of the sparse weights.
+        threshold: float or None. Magnitude threshold of the sparse weights.
 
         TODO:
         Initialize the following instance variables:
@@ -37,14 +605,131 @@ class HopfieldNet():
             Initially an empty Python list.
         - self.wts: handled by `initialize_wts`
         '''
+        if storage == 'auto':
+            storage = 'implicit' if 2*data.shape[0] < data.shape[1] else 'dense'
+        if storage not in ('dense', 'implicit', 'sparse'):
+            raise ValueError(f'Unknown weight storage {storage}. Options are dense, implicit, sparse, auto')
+
         self.num_samps= data.shape[0]
-        self.wts = self.initialize_wts(data)
+        self.num_neurons= data.shape[1]
+        self.dtype = dtype
+        if storage == 'dense':
+            self.wts = self.initialize_wts(data)
+        elif storage == 'sparse':
+            self._wts = sparse_hebbian_wts(data, orig_width, orig_height, radius, threshold, dtype)
+        else:
+            self._wts = None
+        self.storage = storage
         self.orig_height = orig_height
         self.orig_width = orig_width
         self.energy_hist= []
-        self.num_neurons= data.shape[1]
 
-    def initialize_wts(self, data):
+        # Stored patterns and the diagonal of XᵀX (the self-connections removed from the weights)
+        self.patterns = np.asarray(data, dtype=dtype)
+        self._pattern_sq = np.sum(self.patterns**2, axis=0)
+        # Recall fast path, see `build_index`
+        self.index = None
+
+    @property
+    def wts(self):
+        '''ndarray. shape=(M, M). Weight matrix between the M neurons in the Hopfield network.
+
+        With implicit storage, the matrix is only built (once) when it is asked for, after which
+        the network switches to dense storage. With sparse storage, this is a scipy CSR matrix.
+        '''
+        if self._wts is None:
+            patterns, pattern_sq, index = self.patterns, self._pattern_sq, self.index
+            self.initialize_wts(patterns)
+            self.patterns, self._pattern_sq, self.index = patterns, pattern_sq, index
+        return self._wts
+
+    @wts.setter
+    def wts(self, wts):
+        # Weights set from outside no longer come from the stored patterns
+        self._wts = wts
+        self.storage = 'dense'
+        self.patterns = None
+        self._pattern_sq = None
+        self.index = None
+
+    def save(self, path, patterns=True):
+        '''Saves the trained network to the directory `path` so that it can be opened later with
+        `HopfieldNet.load` without retraining.
+
+        The weights and patterns are written as .npy files (which can be opened with np.memmap)
+        next to a small JSON file with the shape metadata.
+
+        Parameters:
+        -----------
+        path: str. Directory to save into. Created if it does not exist.
+        patterns: boolean. Also save the stored pattern matrix. Always saved with implicit storage,
+            because then the patterns are the weights.
+        '''
+        os.makedirs(path, exist_ok=True)
+        meta = {'orig_width': self.orig_width, 'orig_height': self.orig_height,
+                'num_samps': self.num_samps, 'num_neurons': self.num_neurons,
+                'storage': self.storage, 'dtype': np.dtype(self.dtype).name}
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        for name in ('wts.npy', 'wts_data.npy', 'wts_indices.npy', 'wts_indptr.npy', 'patterns.npy'):
+            if os.path.exists(os.path.join(path, name)):
+                os.remove(os.path.join(path, name))
+        if self.storage == 'dense':
+            np.save(os.path.join(path, 'wts.npy'), self._wts)
+        elif self.storage == 'sparse':
+            for name in ('data', 'indices', 'indptr'):
+                np.save(os.path.join(path, f'wts_{name}.npy'), getattr(self._wts, name))
+        if self.patterns is not None and (patterns or self.storage == 'implicit'):
+            np.save(os.path.join(path, 'patterns.npy'), self.patterns)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        '''Opens a network saved with `save`.
+
+        With the default `mmap_mode`, the weights are memory-mapped rather than read: loading takes
+        milliseconds, pages are only read from disk when recall touches them, and processes that
+        load the same network share the same OS page-cache pages instead of private copies.
+
+        Parameters:
+        -----------
+        path: str. Directory the network was saved into.
+        mmap_mode: None or str. Passed to np.load. 'r' opens the arrays read-only,
+            None reads them into memory.
+
+        Returns:
+        -----------
+        HopfieldNet. The saved network.
+        '''
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        net = cls.__new__(cls)
+        net.num_samps = meta['num_samps']
+        net.num_neurons = meta['num_neurons']
+        net.orig_width = meta['orig_width']
+        net.orig_height = meta['orig_height']
+        net.storage = meta['storage']
+        net.dtype = np.dtype(meta['dtype'])
+        net.energy_hist = []
+
+        wts_path = os.path.join(path, 'wts.npy')
+        net._wts = np.load(wts_path, mmap_mode=mmap_mode) if os.path.exists(wts_path) else None
+        if net.storage == 'sparse':
+            from scipy import sparse
+            csr = [np.load(os.path.join(path, f'wts_{name}.npy'), mmap_mode=mmap_mode)
+                   for name in ('data', 'indices', 'indptr')]
+            net._wts = sparse.csr_matrix(tuple(csr), shape=(net.num_neurons, net.num_neurons))
+        patterns_path = os.path.join(path, 'patterns.npy')
+        if os.path.exists(patterns_path):
+            net.patterns = np.load(patterns_path, mmap_mode=mmap_mode)
+            net._pattern_sq = np.sum(net.patterns**2, axis=0)
+        else:
+            net.patterns = net._pattern_sq = None
+        net.index = None
+        return net
+
+    def initialize_wts(self, data, out=None):
         '''Weights are initialized by applying Hebb's Rule to all pairs of M components in each
         data sample (creating a MxM matrix) and summing the matrix derived from each sample
         together.
@@ -54,6 +739,8 @@ class HopfieldNet():
         -----------
         data: ndarray. shape=(N, M). Each data sample is a length M bipolar vector, meaning that
             components are either -1 or +1. Example: [-1, -1, +1, -1, +1, ...]
+        out: None, ndarray, or str. Optional array (or path of a .npy file to memory-map) that the
+            weights are written into. See `hebbian_wts`.
 
         Returns:
         -----------
@@ -62,10 +749,158 @@ class HopfieldNet():
 
         NOTE: It might be helpful to average the weights over samples to avoid large weights.
         '''
-        self.wts = ((data.T @ data)) / (self.num_samps)
-        np.fill_diagonal(self.wts, 0)
+        self.wts = hebbian_wts(data, dtype=self.dtype, out=out)
         return self.wts
 
+    def add_patterns(self, data):
+        '''Stores additional patterns in the trained network without rebuilding the weights.
+
+        The dense weights get a rank-k Hebbian update renormalized by the new number of samples:
+        W <- (N*W + PᵀP) / (N+k), with the diagonal kept at 0. With implicit storage the patterns
+        are simply appended. Sweeping over K pattern counts then costs O(K*M^2) rather than the
+        O(K^2*M^2) of building a new network each time.
+
+        Parameters:
+        -----------
+        data: ndarray. shape=(k, M) or shape=(M,). Bipolar patterns to store.
+        '''
+        data = np.asarray(np.atleast_2d(data), dtype=self.dtype)
+        self._rank_k_update(data, 1)
+        if self.patterns is not None:
+            self.patterns = np.concatenate([self.patterns, data])
+            self._pattern_sq = self._pattern_sq + np.sum(data**2, axis=0)
+        if self.index is not None:
+            self.build_index(**self._index_kwargs)
+
+    def remove_patterns(self, data):
+        '''Removes previously stored patterns from the trained network (the inverse of
+        `add_patterns`): W <- (N*W - PᵀP) / (N-k).
+
+        Parameters:
+        -----------
+        data: ndarray. shape=(k, M) or shape=(M,). Bipolar patterns to remove. Each one must be
+            one of the stored patterns (checked whenever the network still has them).
+        '''
+        data = np.asarray(np.atleast_2d(data), dtype=self.dtype)
+        if data.shape[0] >= self.num_samps:
+            raise ValueError(f'Cannot remove {data.shape[0]} of the {self.num_samps} stored patterns')
+
+        if self.patterns is not None:
+            keep = np.ones(self.num_samps, dtype=bool)
+            for pattern in data:
+                matches = np.flatnonzero(keep & np.all(self.patterns == pattern, axis=1))
+                if matches.size == 0:
+                    raise ValueError('Cannot remove a pattern that is not stored in the network')
+                keep[matches[0]] = False
+
+        self._rank_k_update(data, -1)
+        if self.patterns is not None:
+            self.patterns = self.patterns[keep]
+            self._pattern_sq = self._pattern_sq - np.sum(data**2, axis=0)
+        if self.index is not None:
+            self.build_index(**self._index_kwargs)
+
+    def build_index(self, **index_kwargs):
+        '''Builds a `PatternIndex` over the stored patterns. From then on, `predict` with a
+        fixed-point schedule ('sequential', 'permutation' or 'synchronous') and no `max_iters`
+        returns the stored pattern of every probe that is within the index radius of it without
+        running the dynamics (the same result as the dynamics). The index is rebuilt when patterns
+        are added or removed.
+
+        Parameters:
+        -----------
+        index_kwargs: Keyword arguments of `PatternIndex` (e.g. radius, method).
+
+        Returns:
+        -----------
+        PatternIndex. The index, also kept in `self.index`. `self.index.stats()` has the hit rate.
+        '''
+        if self.patterns is None:
+            raise ValueError('Cannot index a network whose weights do not come from its patterns')
+        if self.storage == 'sparse' and index_kwargs.get('radius') is None:
+            raise ValueError('The guaranteed radius only holds for the full Hebbian weights. '
+                             'Pass a radius to index a sparse network')
+        self.index = PatternIndex(self.patterns, **index_kwargs)
+        self._index_kwargs = index_kwargs
+        # Energy of each stored pattern, reported for the probes that the index recalls
+        self._index_energy = self._init_cache(self.patterns)[1]
+        return self.index
+
+    def _index_applies(self, schedule, max_iters):
+        '''Whether `predict` with this schedule and budget can take the index fast path: the
+        dynamics must run until a fixed point, which the index hits are certain to reach.
+        '''
+        return self.index is not None and schedule != 'random' and max_iters is None
+
+    def _predict_indexed(self, data, recall, return_status):
+        '''Recalls the probes that the index hits as their stored patterns and the other ones
+        with `recall`, then merges `recall_stats` in the order of `data`.
+
+        Parameters:
+        -----------
+        data: ndarray. shape=(num_test_samps, num_features).
+        recall: callable. recall(probes) returns the recalled probes and their status.
+        return_status: boolean. See `predict`.
+        '''
+        match, dist = self.index.query(data)
+        hit = match >= 0
+        recalledImgs = np.zeros_like(data)
+        recalledImgs[hit] = self.patterns[match[hit]]
+        status = np.full(data.shape[0], 'indexed', dtype='<U9')
+
+        stats = {'iters': np.zeros(data.shape[0], dtype=int),
+                 'flips': np.zeros(data.shape[0], dtype=int),
+                 'energy': np.zeros(data.shape[0]),
+                 'overlap': np.zeros((data.shape[0], self.num_samps)),
+                 'time': np.zeros(data.shape[0]),
+                 'status': status,
+                 'energy_hist': [None]*data.shape[0]}
+        # A probe that is recalled by the index would flip exactly its differences with the pattern
+        stats['flips'][hit] = np.count_nonzero(data[hit] != recalledImgs[hit], axis=1)
+        stats['energy'][hit] = self._index_energy[match[hit]]
+        stats['overlap'][hit] = self.patterns[match[hit]] @ self.patterns.T / self.num_neurons
+        for i in np.flatnonzero(hit):
+            stats['energy_hist'][i] = np.array([stats['energy'][i]])
+
+        miss = np.flatnonzero(~hit)
+        if miss.size > 0:
+            recalledImgs[miss], status[miss] = recall(data[miss])
+            for key, value in self.recall_stats.items():
+                if key == 'energy_hist':
+                    for i, e in zip(miss, value):
+                        stats[key][i] = e
+                else:
+                    stats[key][miss] = value
+        self.recall_stats = stats
+        self.energy_hist = list(stats['energy_hist'][-1]) if data.shape[0] > 0 else []
+
+        if return_status:
+            return recalledImgs, status
+        return recalledImgs
+
+    def _rank_k_update(self, data, sign, tile_sz=2048):
+        '''Adds (`sign`=1) or subtracts (`sign`=-1) the Hebbian outer products of the k patterns in
+        `data` to the weights and updates `num_samps`. Dense weights are updated in place, one
+        block of `tile_sz` rows at a time. Sparse weights keep their connectivity.
+        '''
+        new_num_samps = self.num_samps + sign*data.shape[0]
+        if self.storage == 'dense':
+            if not self._wts.flags.writeable:
+                # e.g. opened read-only with `load`: make a private copy to update
+                self._wts = np.array(self._wts)
+            for r in range(0, self.num_neurons, tile_sz):
+                rows = self._wts[r:r+tile_sz]
+                rows *= self.num_samps / new_num_samps
+                rows += (sign / new_num_samps) * (data[:, r:r+tile_sz].T @ data)
+                rows[np.arange(rows.shape[0]), np.arange(r, r + rows.shape[0])] = 0
+        elif self.storage == 'sparse':
+            # The connectivity stays the same: only the existing connections are updated
+            self._wts = self._wts.copy()
+            i, j = np.repeat(np.arange(self.num_neurons), np.diff(self._wts.indptr)), self._wts.indices
+            self._wts.data *= self.num_samps / new_num_samps
+            self._wts.data += (sign / new_num_samps) * np.sum(data[:, i] * data[:, j], axis=0)
+        self.num_samps = new_num_samps
+
     def energy(self, netAct):
         '''Computes the energy of the current network state / activation
 
@@ -73,16 +908,269 @@ class HopfieldNet():
 
         Parameters:
         -----------
-        netAct: ndarray. shape=(num_neurons,)
+        netAct: ndarray. shape=(num_neurons,) or shape=(num_test_samps, num_neurons)
             Current activation of all the neurons in the network.
 
         Returns:
         -----------
         float. The energy.
+            If `netAct` holds one state per row, ndarray. shape=(num_test_samps,) with the energy
+            of each row.
         '''
+        if np.ndim(netAct) == 2:
+            return (-.5)*np.sum(self.local_field(netAct) * netAct, axis=1)
+        if self.storage != 'dense':
+            return (-.5)*np.sum(self.local_field(netAct) * netAct)
         return (-.5)*(np.sum(np.sum(netAct @ self.wts @ netAct.T)))
 
-    def predict(self, data, update_frac=0.1, tol=1e-15, verbose=False, show_dynamics=False):
+    def local_field(self, netAct):
+        '''Computes the local field (net input) h = W·s that every neuron receives from the rest of
+        the network.
+
+        Parameters:
+        -----------
+        netAct: ndarray. shape=(num_neurons,) or shape=(num_test_samps, num_neurons)
+            Current activation of all the neurons in the network.
+
+        Returns:
+        -----------
+        ndarray. Same shape as `netAct`. The local field of each neuron.
+        '''
+        if self.storage == 'implicit':
+            overlaps = netAct @ self.patterns.T
+            return (overlaps @ self.patterns - netAct*self._pattern_sq) / self.num_samps
+        if self.storage == 'sparse':
+            return (self._wts @ netAct.T).T
+        return netAct @ self.wts
+
+    def _field_change(self, delta, inds):
+        '''Change in the local field of every neuron when neurons `inds` change their netAct by
+        `delta` (shape=(num_test_samps, len(inds))): delta @ W[inds, :].
+        Because the weights are symmetric, rows `inds` are also the columns feeding neurons `inds`.
+        '''
+        if self.storage == 'sparse':
+            return (self._wts[inds].T @ delta.T).T
+        return delta @ self._wts[inds]
+
+    def _init_cache(self, netAct):
+        '''Sets up the quantities that recall keeps up to date as neurons flip.
+
+        With dense or sparse weights the cache is the local field h = W·s
+        (shape=(num_test_samps, M)).
+        With implicit weights it is the overlap X·s with every stored pattern
+        (shape=(num_test_samps, N)), from which any component of h can be read in O(N).
+
+        Parameters:
+        -----------
+        netAct: ndarray. shape=(num_test_samps, num_neurons).
+
+        Returns:
+        -----------
+        cache: ndarray. See above.
+        ndarray. shape=(num_test_samps,). Energy of each state.
+        '''
+        if self.storage == 'implicit':
+            overlaps = netAct @ self.patterns.T
+            energy = -(np.sum(overlaps**2, axis=1) - (netAct**2) @ self._pattern_sq) / (2*self.num_samps)
+            return overlaps, energy
+        field = self.local_field(netAct)
+        return field, -.5*np.sum(netAct * field, axis=1)
+
+    def _cached_field(self, netAct, cache, inds):
+        '''Local field of neurons `inds` read from the recall cache (see `_init_cache`).'''
+        if self.storage == 'implicit':
+            return (cache @ self.patterns[:, inds] - netAct[:, inds]*self._pattern_sq[inds]) / self.num_samps
+        return cache[:, inds]
+
+    def _block_change(self, cache, inds, oldAct, delta, field):
+        '''Change in the energy of each state and in the recall cache (see `_init_cache`) when
+        neurons `inds` change their netAct from `oldAct` by `delta` (shape=(num_test_samps, k)).
+        `field` is their local field before the change. Because the weights are symmetric,
+        dE = -Δs·h - ½ Δs·WΔs, which only needs the neurons that change.
+        '''
+        if self.storage == 'implicit':
+            d_overlaps = delta @ self.patterns[:, inds].T
+            d_self = ((oldAct + delta)**2 - oldAct**2) @ self._pattern_sq[inds]
+            d_energy = -(np.sum(d_overlaps*(2*cache + d_overlaps), axis=1) - d_self) / (2*self.num_samps)
+            return d_energy, d_overlaps
+
+        d_field = self._field_change(delta, inds)
+        d_energy = -np.sum(delta * field, axis=1) - .5*np.sum(delta * d_field[:, inds], axis=1)
+        return d_energy, d_field
+
+    def _update_neurons(self, netAct, cache, inds, descent=False):
+        '''Sets neurons `inds` of every state (row) in `netAct` to the sign of their local field,
+        then brings the recall cache (see `_init_cache`) up to date in place with a rank-k
+        correction that only involves the k neurons that actually flipped.
+
+        Parameters:
+        -----------
+        netAct: ndarray. shape=(num_test_samps, num_neurons). Modified in place.
+        cache: ndarray. Recall cache of `netAct`. Modified in place.
+        inds: ndarray of unique ints. Indices of the neurons to update.
+        descent: boolean. Never let a block update raise the energy. Flipping several connected
+            neurons at once can raise it (and so oscillate). In the states where the block would
+            not lower the energy, only the neuron with the strongest field flips, which always
+            lowers it because there are no self-connections.
+
+        Returns:
+        -----------
+        ndarray. shape=(num_test_samps,). Change in the energy of each state.
+        ndarray of ints. shape=(num_test_samps,). Number of neurons that flipped in each state.
+        '''
+        field = self._cached_field(netAct, cache, inds)
+        newAct = np.sign(field)
+        delta = newAct - netAct[:, inds]
+        num_flips = np.count_nonzero(delta, axis=1)
+        flipped = np.any(delta != 0, axis=0)
+        if not np.any(flipped):
+            return np.zeros(netAct.shape[0]), num_flips
+
+        inds, delta, field = inds[flipped], delta[:, flipped], field[:, flipped]
+        oldAct = netAct[:, inds]
+        d_energy, d_cache = self._block_change(cache, inds, oldAct, delta, field)
+
+        if descent:
+            worse = (num_flips > 1) & (d_energy >= 0)
+            if np.any(worse):
+                strongest = np.argmax(np.where(delta[worse] != 0, np.abs(field[worse]), -1), axis=1)
+                single = np.zeros_like(delta[worse])
+                single[np.arange(single.shape[0]), strongest] = \
+                    delta[worse][np.arange(single.shape[0]), strongest]
+                delta[worse] = single
+                num_flips[worse] = 1
+                d_energy, d_cache = self._block_change(cache, inds, oldAct, delta, field)
+
+        netAct[:, inds] = oldAct + delta
+        cache += d_cache
+        return d_energy, num_flips
+
+    def _run_dynamics(self, netAct, update_frac=0.1, tol=1e-15, schedule='random', max_iters=None,
+                      on_step=None, sample_ids=None):
+        '''Runs the recall dynamics on every state (row) of `netAct` until each one has stabilized,
+        entered a 2-cycle or used up its iteration budget. Rows that are done stop being updated.
+
+        Parameters:
+        -----------
+        netAct: ndarray. shape=(num_test_samps, num_neurons). Initial states. Modified in place.
+        update_frac, tol, schedule, max_iters: See `predict`.
+        on_step: callable or None. Called with the initial states and after every time step as
+            on_step(step, samples, netAct, energy, num_flips) for the samples that were updated
+            (see `DynamicsRecorder.__call__`).
+        sample_ids: ndarray of ints or None. Index of each row of `netAct` in the data given to
+            `predict` (passed to `on_step`). Defaults to 0, 1, ..., num_test_samps-1.
+
+        Returns:
+        -----------
+        ndarray of str. shape=(num_test_samps,). Status of each sample:
+            'converged', 'cycled' or 'max_iters'.
+        dict. Telemetry of each sample (see `recall_stats` in `predict`).
+        '''
+        if schedule not in ('random', 'permutation', 'sequential', 'synchronous'):
+            raise ValueError(f'Unknown update schedule {schedule}. Options are random, permutation, '
+                             'sequential, synchronous')
+        num_samps, M = netAct.shape
+        numCells = math.ceil(update_frac * M)
+        # Sweeps end at a fixed point only if block updates never raise the energy
+        descent = schedule in ('permutation', 'sequential')
+
+        start = time.perf_counter()
+        cache, curr_e = self._init_cache(netAct)
+        # Energy of every sample on every time step (samples that are done keep their energy)
+        energies = [curr_e.copy()]
+        if sample_ids is None:
+            sample_ids = np.arange(num_samps)
+        if on_step is not None:
+            on_step(0, sample_ids, netAct, curr_e, np.zeros(num_samps, dtype=int))
+        status = np.full(num_samps, 'running', dtype='<U9')
+        iters = np.zeros(num_samps, dtype=int)
+        flips = np.zeros(num_samps, dtype=int)
+        wall_time = np.zeros(num_samps)
+        active = np.ones(num_samps, dtype=bool)
+
+        # Sweep schedules: position in the current sweep and whether each sample flipped during it
+        sweep_pos = 0
+        sweep_flipped = np.zeros(num_samps, dtype=bool)
+        # Synchronous schedule: hashes of the states one and two time steps ago
+        if schedule == 'synchronous':
+            state_hashes = np.array([[hash(row.tobytes())]*2 for row in netAct], dtype=np.int64)
+
+        while np.any(active):
+            rows = np.flatnonzero(active)
+
+            if schedule == 'random':
+                inds = np.unique(np.random.choice(M, numCells))
+            elif schedule == 'synchronous':
+                inds = np.arange(M)
+            else:
+                if sweep_pos == 0:
+                    order = np.random.permutation(M) if schedule == 'permutation' else np.arange(M)
+                inds = np.sort(order[sweep_pos:sweep_pos + numCells])
+                sweep_pos += numCells
+
+            if rows.size == num_samps:
+                rowAct = netAct
+                d_energy, num_flips = self._update_neurons(netAct, cache, inds, descent)
+            else:
+                # Only the samples that are not done pay for the update
+                rowAct, rowCache = netAct[rows], cache[rows]
+                d_energy, num_flips = self._update_neurons(rowAct, rowCache, inds, descent)
+                netAct[rows], cache[rows] = rowAct, rowCache
+            curr_e[rows] += d_energy
+            iters[rows] += 1
+            flips[rows] += num_flips
+
+            if schedule == 'random':
+                done = -d_energy <= tol
+            elif schedule == 'synchronous':
+                # A state that repeats the one from two steps ago (but not the last one) is a 2-cycle
+                done = num_flips == 0
+                hashes = np.array([hash(netAct[r].tobytes()) for r in rows], dtype=np.int64)
+                cycled = ~done & (hashes == state_hashes[rows, 1])
+                status[rows[cycled]] = 'cycled'
+                state_hashes[rows, 1] = state_hashes[rows, 0]
+                state_hashes[rows, 0] = hashes
+                done |= cycled
+            else:
+                # Fixed point: a full sweep over all the neurons without a single flip
+                sweep_flipped[rows] |= num_flips > 0
+                done = np.zeros(rows.size, dtype=bool)
+                if sweep_pos >= M:
+                    done = ~sweep_flipped[rows]
+                    sweep_flipped[:] = False
+                    sweep_pos = 0
+            status[rows[done & (status[rows] == 'running')]] = 'converged'
+
+            if max_iters is not None:
+                out_of_budget = ~done & (iters[rows] >= max_iters)
+                status[rows[out_of_budget]] = 'max_iters'
+                done |= out_of_budget
+            active[rows] = ~done
+            wall_time[rows[done]] = time.perf_counter() - start
+
+            energies.append(curr_e.copy())
+            if on_step is not None:
+                on_step(iters[rows[0]], sample_ids[rows], rowAct, curr_e[rows], num_flips)
+
+        energies = np.array(energies)
+        if self.patterns is not None:
+            overlap = (netAct @ self.patterns.T) / M
+        else:
+            overlap = np.empty((num_samps, 0))
+        stats = {'iters': iters,
+                 'flips': flips,
+                 'energy': curr_e,
+                 'overlap': overlap,
+                 'time': wall_time,
+                 'status': status,
+                 'energy_hist': [energies[:iters[i] + 1, i] for i in range(num_samps)]}
+        # Like the original `predict`, `energy_hist` has the energy history of the last sample
+        self.energy_hist = list(stats['energy_hist'][-1]) if num_samps > 0 else []
+        return status, stats
+
+    def predict(self, data, update_frac=0.1, tol=1e-15, verbose=False, show_dynamics=False,
+                batch=False, schedule='random', max_iters=None, return_status=False, recorder=None,
+                on_step=None, use_index=True):
         '''Use each data sample in `data` to look up the associated memory stored in the network.
 
         Parameters:
@@ -99,12 +1187,54 @@ class HopfieldNet():
         verbose: boolean. You should only print diagonstic info when set to True. Minimal print outs
             otherwise.
         show_dynamics: boolean. If true, plot and update an image of the memory that the network is
-            retrieving on each time step.
+            retrieving on each time step. The states are recorded (see `recorder`) and played back
+            once recall is done, so plotting does not slow down the dynamics.
+        batch: boolean. If true, advance all the test samples together as one
+            (num_test_samps, num_neurons) state matrix (see `predict_batch`) instead of one-by-one.
+        schedule: str. Which neurons are updated on each time step. Options are:
+            'random': `update_frac` of the neurons drawn at random (with replacement). Stops once
+                the energy changes by less than `tol`.
+            'permutation': sweeps over the neurons in a new random order every sweep,
+                `update_frac` of them per time step.
+            'sequential': like 'permutation', but always in the order 0, 1, ..., M-1.
+            'synchronous': all the neurons at once.
+            The sweep schedules and 'synchronous' stop at a fixed point: a full sweep (time step)
+            in which no neuron flips. 'synchronous' also stops when the state repeats the one from
+            two time steps ago (a 2-cycle). The sweep schedules never raise the energy (see
+            `_update_neurons`), so like one-neuron-at-a-time updates they cannot cycle and always
+            reach a fixed point. `tol` is only used by 'random'.
+        max_iters: int or None. Maximum number of time steps for each sample. None for no limit.
+        return_status: boolean. Also return the status of each sample.
+        recorder: DynamicsRecorder or None. Records the states during recall. With `show_dynamics`
+            and no recorder, one that records every time step is made and kept in `self.recorder`.
+        on_step: callable or None. Per-step hook, called with the initial states and after every
+            time step as on_step(step, samples, netAct, energy, num_flips), where `samples` are the
+            indices (in `data`) of the samples updated on that step and the other arrays have one
+            row per sample (see `DynamicsRecorder.__call__`). None costs nothing.
+        use_index: boolean. If an index was built (see `build_index`), the probes that the index
+            hits are returned as their stored pattern right away, and only the other probes go
+            through the dynamics (and `show_dynamics`, `recorder`, `on_step`). Only used with the
+            fixed-point schedules and `max_iters`=None, where it does not change the results
+            ('random' and a `max_iters` budget may stop before the stored pattern).
 
         Returns:
         -----------
         ndarray. shape=(num_test_samps, num_features)
             Retrieved memory for each data sample, in each case once the network has stablized.
+        ndarray of str. shape=(num_test_samps,). Only if `return_status` is True.
+            'converged', 'cycled', 'max_iters' or 'indexed' (recalled by the index) for each sample.
+
+        After recall, `self.recall_stats` has the telemetry of every sample, a dict with
+            'iters': ndarray of ints. Time steps until the sample was done.
+            'flips': ndarray of ints. Total number of neuron flips.
+            'energy': ndarray. Final energy.
+            'overlap': ndarray. shape=(num_test_samps, num_samps). Final overlap s·x/M with each
+                stored pattern x (1 means recalled exactly, -1 the inverted pattern).
+            'time': ndarray. Wall time in seconds until the sample was done. With `batch`, the
+                time since the start of the batch.
+            'status': ndarray of str. See `return_status`.
+            'energy_hist': list of ndarrays. Energy on every time step of each sample.
+        `self.energy_hist` keeps the energy history of the last sample.
 
         TODO:
         - Process the test data samples one-by-one, setting them to as the initial netAct then
@@ -169,41 +1299,197 @@ class HopfieldNet():
         if np.ndim(data) < 2:
             data = np.expand_dims(data, axis=0)
 
+        if use_index and self._index_applies(schedule, max_iters):
+            def recall(probes):
+                return self.predict(probes, update_frac, tol, verbose, show_dynamics, batch,
+                                    schedule, max_iters, True, recorder, on_step, use_index=False)
+            return self._predict_indexed(data, recall, return_status)
+
+        if show_dynamics == True and recorder is None:
+            recorder = DynamicsRecorder(self.num_neurons, capacity=2000)
+        if recorder is not None:
+            recorder.reset()
+            self.recorder = recorder
+
+        if batch:
+            results = self.predict_batch(data, update_frac=update_frac, tol=tol, verbose=verbose,
+                                         schedule=schedule, max_iters=max_iters,
+                                         return_status=return_status, recorder=recorder,
+                                         on_step=on_step)
+        else:
+            results = self._predict_serial(data, update_frac, tol, verbose, schedule, max_iters,
+                                           return_status, _step_hook(recorder, on_step))
+
         if show_dynamics == True:
-                fig = plt.figure()
-                ax = fig.add_subplot(1, 1, 1)
+            recorder.show(self.orig_width, self.orig_height)
+        return results
 
-        recalledImgs = np.zeros_like(data)
+    def predict_parallel(self, data, workers=None, shard_sz=64, seed=None, return_status=False,
+                         use_index=True, **predict_kwargs):
+        '''Runs `predict` on shards of the test samples in a pool of worker processes.
 
-        for i in range(data.shape[0]):
+        The weights (and stored patterns) are copied into shared memory once. Each worker attaches
+        to the shared blocks when it starts, so every process reads the same physical pages instead
+        of unpickling its own copy of the network, and memory stays flat as workers are added.
+        Only the probe shards and the recalled states travel between processes.
 
-            netAct = data[i,:].copy()
-            self.energy_hist= []
+        Parameters:
+        -----------
+        data: ndarray. shape=(num_test_samps, num_features). Bipolar probes.
+        workers: int or None. Number of worker processes. None uses all the CPUs, 1 runs the
+            shards in the current process (without shared memory).
+        shard_sz: int. Number of probes per shard. It does not depend on `workers`, so that the
+            shards (and their seeds) are the same for any number of workers.
+        seed: int or None. Seed of the random neuron selection. Shard k is recalled with the
+            seed SeedSequence([seed, k]), so the same seed and `shard_sz` give the same results for
+            any `workers`. None draws the seed from np.random.
+        return_status: boolean. Also return the status of each sample (see `predict`).
+        use_index: boolean. See `predict`. The index is looked up in the current process and only
+            the probes that it misses are sent to the workers.
+        predict_kwargs: Keyword arguments of `predict` (e.g. schedule, max_iters). By default the
+            probes of a shard are recalled together (batch=True). `show_dynamics`, `recorder` and
+            `on_step` only see the shards recalled in the current process.
 
-            self.energy_hist.append(self.energy(netAct))
+        Returns:
+        -----------
+        ndarray. shape=(num_test_samps, num_features). Retrieved memory for each data sample, in
+            the order of `data`.
+        ndarray of str. shape=(num_test_samps,). Only if `return_status` is True.
 
-            #We use lazy evaluation to deal with a list of length less than 3
-            while (len(self.energy_hist)==1) or (self.energy_hist[-2] - self.energy_hist[-1] > tol):
+        `self.recall_stats` is set like in `predict`, in the order of `data`.
+        '''
+        if np.ndim(data) < 2:
+            data = np.expand_dims(data, axis=0)
+        if data.shape[0] == 0:
+            # Nothing to send to the workers: empty result and recall_stats
+            return self.predict(data, return_status=return_status, use_index=False,
+                                **predict_kwargs)
+        if use_index and self._index_applies(predict_kwargs.get('schedule', 'random'),
+                                             predict_kwargs.get('max_iters')):
+            def recall(probes):
+                return self.predict_parallel(probes, workers, shard_sz, seed, True, use_index=False,
+                                             **predict_kwargs)
+            return self._predict_indexed(data, recall, return_status)
+        workers = workers or os.cpu_count()
+        if seed is None:
+            seed = np.random.randint(2**31)
+        predict_kwargs.setdefault('batch', True)
+        predict_kwargs['use_index'] = False
+
+        starts = range(0, data.shape[0], shard_sz)
+        seeds = [np.random.SeedSequence([seed, k]).generate_state(1)[0] for k in range(len(starts))]
+        # Workers use the network they attached to (None), the current process uses self
+        net = self if workers == 1 else None
+        tasks = [(net, data[s:s + shard_sz], sd, predict_kwargs) for s, sd in zip(starts, seeds)]
+        if workers == 1:
+            results = list(map(_predict_shard, tasks))
+        else:
+            spec, shms = _share_arrays(self)
+            try:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_attach_arrays,
+                                         initargs=(spec,)) as pool:
+                    # map keeps the shards in order
+                    results = list(pool.map(_predict_shard, tasks))
+            finally:
+                for shm in shms:
+                    shm.close()
+                    shm.unlink()
+
+        recalledImgs = np.concatenate([recalled for recalled, _, _ in results])
+        status = np.concatenate([status for _, status, _ in results])
+        shard_stats = [stats for _, _, stats in results]
+        self.recall_stats = {key: sum((stats[key] for stats in shard_stats), [])
+                             if key == 'energy_hist' else
+                             np.concatenate([stats[key] for stats in shard_stats])
+                             for key in shard_stats[0]}
+        self.energy_hist = list(self.recall_stats['energy_hist'][-1])
+        if return_status:
+            return recalledImgs, status
+        return recalledImgs
 
-                numCells = math.ceil(update_frac * self.num_neurons)
-                inds = np.random.choice(self.num_neurons, numCells)
+    def _state_dtype(self, data):
+        '''Data type of the netAct arrays during recall: int8 (1 byte per neuron) for integer
+        bipolar data, otherwise the dtype of `data`.
+        '''
+        if np.issubdtype(data.dtype, np.integer) and data.size > 0 and data.min() >= -1 and data.max() <= 1:
+            return np.int8
+        return data.dtype
 
-                netAct[inds]= np.sign(netAct @ self.wts[:,inds])
+    def _predict_serial(self, data, update_frac, tol, verbose, schedule, max_iters, return_status,
+                        on_step):
+        '''Runs `predict` on the test samples one-by-one.'''
+        recalledImgs = np.zeros_like(data)
+        status = np.zeros(data.shape[0], dtype='<U9')
+        sample_stats = []
 
-                self.energy_hist.append(self.energy(netAct))
+        for i in range(data.shape[0]):
 
-                if show_dynamics == True:
+            # Keep the sample 2D so that it shares the update code with `predict_batch`.
+            # Energy is tracked from the recall cache, so each step costs O(k*M) (O(k*N) if implicit)
+            netAct = data[i:i+1,:].astype(self._state_dtype(data))
+            sample_status, stats = self._run_dynamics(netAct, update_frac, tol, schedule, max_iters,
+                                                      on_step=on_step, sample_ids=np.array([i]))
+            status[i] = sample_status[0]
+            sample_stats.append(stats)
+
+            if verbose:
+                print(f'Sample {i}: {status[i]} after {stats["iters"][0]} time steps, '
+                      f'{stats["flips"][0]} flips')
+
+            recalledImgs[i] =  netAct[0]
+
+        if not sample_stats:
+            # No test samples: empty telemetry (and status) of the right shapes
+            status, stats = self._run_dynamics(data.astype(self._state_dtype(data)), update_frac,
+                                               tol, schedule, max_iters)
+            sample_stats.append(stats)
+        self.recall_stats = {key: sum((stats[key] for stats in sample_stats), [])
+                             if key == 'energy_hist' else
+                             np.concatenate([stats[key] for stats in sample_stats])
+                             for key in sample_stats[0]}
+        if return_status:
+            return recalledImgs, status
+        return recalledImgs
 
-                    ax.imshow(netAct.reshape(64,64), cmap='bone')
-                    ax.set_title("Energy: " + str(self.energy_hist[-1]), fontsize=12)
-                    
-                    display(fig)
-                    clear_output(wait=True)
-                    plt.pause(.1)
+    def predict_batch(self, data, update_frac=0.1, tol=1e-15, verbose=False, schedule='random',
+                      max_iters=None, return_status=False, recorder=None, on_step=None):
+        '''Batched version of `predict`: looks up the memory associated with every data sample
+        in `data` at the same time.
 
-            recalledImgs[i] =  netAct
+        All the test samples are advanced together as one (num_test_samps, num_neurons) state
+        matrix. On each time step the same subset of neurons is updated in every sample that is
+        not done yet, so the N vector-matrix products of `predict` become one matrix-matrix
+        product. Each sample stops being updated as soon as it is done.
 
-        return recalledImgs
+        Parameters:
+        -----------
+        data: ndarray. shape=(num_test_samps, num_features)
+            Each data sample is a length M bipolar vector.
+        update_frac, tol, schedule, max_iters, return_status, recorder, on_step: See `predict`.
+            `self.recall_stats` is also set like in `predict`.
+        verbose: boolean. Print how many samples ended with each status.
+
+        Returns:
+        -----------
+        ndarray. shape=(num_test_samps, num_features)
+            Retrieved memory for each data sample, in each case once the network has stablized.
+        ndarray of str. shape=(num_test_samps,). Only if `return_status` is True (see `predict`).
+        '''
+        if np.ndim(data) < 2:
+            data = np.expand_dims(data, axis=0)
+
+        netAct = data.astype(self._state_dtype(data))
+        status, self.recall_stats = self._run_dynamics(netAct, update_frac, tol, schedule, max_iters,
+                                                       on_step=_step_hook(recorder, on_step))
+        netAct = netAct.astype(data.dtype, copy=False)
+
+        if verbose:
+            outcomes, counts = np.unique(status, return_counts=True)
+            print(', '.join(f'{count} {outcome}' for outcome, count in zip(outcomes, counts)))
+
+        if return_status:
+            return netAct, status
+        return netAct
 
 
 
@@ -292,13 +1578,190 @@ class HopfieldNet():
         # return recalledImgs
 
 
+class DenseAssociativeMemory():
+    '''Dense associative memory (a "modern" Hopfield network) of bipolar patterns.
 
+    Instead of the pairwise MxM weights of HopfieldNet, the network keeps the NxM pattern matrix X
+    and has a sharply peaked energy of the overlaps X·s of the state s with the stored patterns:
+        'softmax':    E = -1/beta * log(sum_mu exp(beta * x_mu·s))
+        'polynomial': E = -sum_mu max(x_mu·s, 0)**degree
+    Recall updates all the neurons at once to the sign of Xᵀ·F'(X·s), which for 'softmax' is
+    Xᵀ·softmax(beta * X·s). Each step is two (num_test_samps, M) x (M, N) matrix products, no
+    MxM matrix is ever built, and the closest pattern is usually retrieved in one or two steps.
+    Because the energy separates the patterns much more sharply than the quadratic Hebbian one,
+    many more than the ~0.14*M patterns of HopfieldNet can be stored.
+    '''
+    def __init__(self, data, orig_width, orig_height, energy='softmax', beta=1.0, degree=3,
+                 dtype=np.float64):
+        '''DenseAssociativeMemory constructor
 
+        Parameters:
+        -----------
+        data: ndarray. shape=(N, M). Bipolar patterns to store.
+        orig_width, orig_height: ints. Original image size (see HopfieldNet).
+        energy: str. 'softmax' (exponential of the overlaps) or 'polynomial'.
+        beta: float. Inverse temperature of the 'softmax' energy. The overlaps are dot products
+            in [-M, M], so beta around 1 already picks out the single closest pattern.
+        degree: int. Degree of the 'polynomial' energy (2 is the classical Hopfield network).
+        dtype: numpy float dtype. Data type of the stored patterns.
+        '''
+        if energy not in ('softmax', 'polynomial'):
+            raise ValueError(f'Unknown energy {energy}. Options are softmax, polynomial')
 
+        self.num_samps = data.shape[0]
+        self.num_neurons = data.shape[1]
+        self.orig_width = orig_width
+        self.orig_height = orig_height
+        self.energy_fun = energy
+        self.beta = beta
+        self.degree = degree
+        self.dtype = dtype
+        self.energy_hist = []
+        self.patterns = np.asarray(data, dtype=dtype)
+
+    def add_patterns(self, data):
+        '''Stores more patterns. shape=(num_new, M).'''
+        self.patterns = np.concatenate([self.patterns, np.asarray(data, dtype=self.dtype)])
+        self.num_samps = self.patterns.shape[0]
 
+    def energy(self, netAct):
+        '''Computes the energy of the state(s) `netAct`.
+
+        Parameters:
+        -----------
+        netAct: ndarray. shape=(num_neurons,) or shape=(num_test_samps, num_neurons).
 
+        Returns:
+        -----------
+        float, or ndarray shape=(num_test_samps,) when `netAct` has one state per row.
+        '''
+        overlaps = np.atleast_2d(netAct).astype(self.dtype, copy=False) @ self.patterns.T
+        if self.energy_fun == 'softmax':
+            # log-sum-exp shifted by the largest overlap, so exp never overflows
+            z = self.beta*overlaps
+            z_max = np.max(z, axis=1)
+            energy = -(z_max + np.log(np.sum(np.exp(z - z_max[:, np.newaxis]), axis=1))) / self.beta
+        else:
+            energy = -np.sum(np.maximum(overlaps, 0)**self.degree, axis=1)
+        return energy if np.ndim(netAct) == 2 else energy[0]
+
+    def separation(self, overlaps):
+        '''Weight of each stored pattern in the field of each state, F'(overlaps) up to a positive
+        factor per state (which does not change the sign of the field).
 
+        Parameters:
+        -----------
+        overlaps: ndarray. shape=(num_test_samps, num_samps). X·s of each state.
 
+        Returns:
+        -----------
+        ndarray. shape=(num_test_samps, num_samps).
+        '''
+        if self.energy_fun == 'softmax':
+            z = self.beta*overlaps
+            z = np.exp(z - np.max(z, axis=1, keepdims=True))
+            return z / np.sum(z, axis=1, keepdims=True)
+        return np.maximum(overlaps, 0)**(self.degree - 1)
+
+    def local_field(self, netAct):
+        '''Xᵀ·F'(X·s) of each state. shape=(num_test_samps, num_neurons).'''
+        netAct = np.atleast_2d(netAct).astype(self.dtype, copy=False)
+        return self.separation(netAct @ self.patterns.T) @ self.patterns
+
+    def predict(self, data, max_iters=10, verbose=False, return_status=False, chunk_sz=1024,
+                recorder=None, on_step=None):
+        '''Looks up the memory associated with every data sample, all the samples at once.
+
+        Each time step sets every neuron to the sign of its field (see `local_field`); neurons with
+        a field of exactly 0 keep their value. A sample is done at a fixed point (a step without a
+        flip), when its state repeats the one from two steps ago (a 2-cycle) or after `max_iters`
+        steps. Samples that are done stop being updated.
 
+        Parameters:
+        -----------
+        data: ndarray. shape=(num_test_samps, num_features). Bipolar probes.
+        max_iters: int. Maximum number of time steps for each sample.
+        verbose: boolean. Print how many samples ended with each status.
+        return_status: boolean. Also return the status of each sample.
+        chunk_sz: int. Number of samples recalled together, which bounds the
+            (chunk_sz, num_samps) overlap matrices.
+        recorder, on_step: See `HopfieldNet.predict`.
 
+        Returns:
+        -----------
+        ndarray. shape=(num_test_samps, num_features). Retrieved memory for each data sample.
+        ndarray of str. shape=(num_test_samps,). Only if `return_status` is True.
+            'converged', 'cycled' or 'max_iters' for each sample.
 
+        After recall, `self.recall_stats` has the telemetry of every sample, with the same keys as
+        in `HopfieldNet.predict`.
+        '''
+        if np.ndim(data) < 2:
+            data = np.expand_dims(data, axis=0)
+        if recorder is not None:
+            recorder.reset()
+            self.recorder = recorder
+        on_step = _step_hook(recorder, on_step)
+        num_samps, M = data.shape
+
+        start = time.perf_counter()
+        netAct = data.astype(self.dtype)
+        status = np.full(num_samps, 'max_iters', dtype='<U9')
+        iters = np.zeros(num_samps, dtype=int)
+        flips = np.zeros(num_samps, dtype=int)
+        wall_time = np.zeros(num_samps)
+        energy_hist = [None]*num_samps
+
+        for c in range(0, num_samps, chunk_sz):
+            rows = np.arange(c, min(c + chunk_sz, num_samps))
+            curr_e = self.energy(netAct[rows])
+            energies = {r: [e] for r, e in zip(rows, curr_e)}
+            if on_step is not None:
+                on_step(0, rows, netAct[rows], curr_e, np.zeros(rows.size, dtype=int))
+            prevAct = np.zeros_like(netAct[rows])
+
+            for step in range(1, max_iters + 1):
+                rowAct = netAct[rows]
+                field = self.local_field(rowAct)
+                newAct = np.where(field == 0, rowAct, np.sign(field))
+                num_flips = np.count_nonzero(newAct != rowAct, axis=1)
+                netAct[rows] = newAct
+                iters[rows] = step
+                flips[rows] += num_flips
+                curr_e = self.energy(newAct)
+                for r, e in zip(rows, curr_e):
+                    energies[r].append(e)
+                if on_step is not None:
+                    on_step(step, rows, newAct, curr_e, num_flips)
+
+                converged = num_flips == 0
+                cycled = ~converged & np.all(newAct == prevAct, axis=1)
+                status[rows[converged]] = 'converged'
+                status[rows[cycled]] = 'cycled'
+                done = converged | cycled
+                wall_time[rows[done]] = time.perf_counter() - start
+                prevAct = rowAct[~done]
+                rows = rows[~done]
+                if rows.size == 0:
+                    break
+            wall_time[rows] = time.perf_counter() - start
+            for r, e in energies.items():
+                energy_hist[r] = np.array(e)
+
+        self.recall_stats = {'iters': iters,
+                             'flips': flips,
+                             'energy': np.array([e[-1] for e in energy_hist]),
+                             'overlap': (netAct @ self.patterns.T) / M,
+                             'time': wall_time,
+                             'status': status,
+                             'energy_hist': energy_hist}
+        self.energy_hist = list(energy_hist[-1]) if num_samps > 0 else []
+        netAct = netAct.astype(data.dtype, copy=False)
+
+        if verbose:
+            outcomes, counts = np.unique(status, return_counts=True)
+            print(', '.join(f'{count} {outcome}' for outcome, count in zip(outcomes, counts)))
+
+        if return_status:
+            return netAct, status
+        return netAct
@@ -4,6 +4,8 @@ CS443: Computational Neuroscience
 YOUR NAMES HERE
 Project 2: Content Addressable Memory
 '''
+import glob
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
 from PIL import ImageOps
@@ -34,7 +36,84 @@ def resize_imgs(imgs, width, height):
     return np.array(imgs)
 
 
-def img2binaryvectors(data, bipolar=True):
+def load_img(path, width, height):
+    '''Opens the image file `path`, resizes it to (`width` x `height`) resolution and converts it
+    to grayscale, like `resize_imgs` does for one image.
+
+    Parameters:
+    -----------
+    path: str. Path of the image file.
+    width : int. Desired width of the image.
+    height : int. Desired height of the image.
+
+    Returns:
+    -----------
+    ndarray of uint8s. shape=(height, width).
+        Grayscale image
+    '''
+    with Image.open(path) as img:
+        return np.array(ImageOps.grayscale(img.resize((width, height))))
+
+
+def ingest_imgs(paths, width, height, out=None, chunk_sz=256, workers=None, binarize=True,
+                dtype=int):
+    '''Streams image files from disk into a (num_imgs, height*width) array, without ever holding
+    the whole corpus in memory.
+
+    Images are decoded, resized and grayscaled in a thread pool (PIL releases the GIL while doing
+    this), then passed through `img2binaryvectors` and written to `out` one chunk of `chunk_sz`
+    images at a time. The next chunk is decoded while the current one is binarized, and peak
+    memory is bounded by the chunk size rather than by the number of images.
+
+    Parameters:
+    -----------
+    paths: str or list of str. Image file paths, or a glob pattern (e.g. 'data/*.png').
+        Glob matches are sorted.
+    width : int. Desired width with which to resize every image.
+    height : int. Desired height with which to resize every image.
+    out: None, ndarray, or str. Where to write the result.
+        None: allocate a new array.
+        ndarray: preallocated array (or np.memmap) with shape=(num_imgs, height*width).
+        str: path of a .npy file that is created and memory-mapped (see np.lib.format.open_memmap).
+    chunk_sz: int. Number of images processed at a time.
+    workers: int or None. Number of threads decoding images (None: ThreadPoolExecutor default).
+    binarize: boolean. If False, write the flattened grayscale pixels instead of bipolar vectors.
+    dtype: numpy integer dtype. Data type of the bipolar vectors (e.g. np.int8).
+
+    Returns:
+    -----------
+    ndarray. shape=(num_imgs, height*width).
+        Bipolar (-1, +1) feature vectors, or uint8 grayscale pixels if `binarize` is False.
+    '''
+    if isinstance(paths, str):
+        paths = sorted(glob.glob(paths))
+    num_imgs = len(paths)
+    dtype = dtype if binarize else np.uint8
+
+    if out is None:
+        out = np.empty((num_imgs, height*width), dtype=dtype)
+    elif isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=(num_imgs, height*width))
+    elif out.shape != (num_imgs, height*width):
+        raise ValueError(f'out has shape {out.shape}, expected {(num_imgs, height*width)}')
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(start):
+            return [pool.submit(load_img, path, width, height) for path in paths[start:start+chunk_sz]]
+
+        pending = submit(0)
+        for start in range(0, num_imgs, chunk_sz):
+            chunk = np.array([future.result() for future in pending])
+            pending = submit(start + chunk_sz)
+
+            if binarize:
+                img2binaryvectors(chunk, dtype=out.dtype, out=out[start:start+len(chunk)])
+            else:
+                out[start:start+len(chunk)] = chunk.reshape(len(chunk), -1)
+    return out
+
+
+def img2binaryvectors(data, bipolar=True, dtype=int, out=None, chunk_sz=256):
     '''Transform grayscale images into normalized, centered, binarized 1D feature vectors with
     bipolar values (-1, +1)
 
@@ -42,6 +121,11 @@ def img2binaryvectors(data, bipolar=True):
     -----------
     data: ndarray. shape=(N, Iy (height), Ix (width)).
         Grayscale images
+    bipolar: boolean. If False, the values are binary (0, +1) instead of bipolar.
+    dtype: numpy integer dtype. Data type of the result. np.int8 takes 1 byte per value instead
+        of the 8 bytes of the default int64.
+    out: ndarray or None. Optional preallocated array (shape=(N, Iy*Ix)) to write the result into.
+    chunk_sz: int. Number of images normalized at a time (bounds the float temporaries).
 
     Returns:
     -----------
@@ -52,26 +136,25 @@ def img2binaryvectors(data, bipolar=True):
     - Center the image then threshold at 0 so that values are either -1 or +1.
     - Reshape so that the result is a 1D vector (see shape above)
     '''
+    N = data.shape[0]
+    flat_data = np.reshape(data, (N, int(np.prod(data.shape[1:]))))
+    if out is None:
+        out = np.empty(flat_data.shape, dtype=dtype)
+    off_value = -1 if bipolar else 0
 
-    polar_binary_imgs = np.zeros(np.shape(data)).astype(int)
-
-    for i in range(np.shape(data)[0]):
-        
-        curr_data = data[i,:,:]
-        maxData = np.max(curr_data)
-        minData = np.min(curr_data)
-        curr_data = (curr_data - minData)/(maxData - minData)
-        curr_data = curr_data - np.mean(curr_data )
-
-        curr_data[curr_data >= 0] = 1
-        curr_data[curr_data < 0] = -1
-
-        polar_binary_imgs[i,:,:] = curr_data
-
-    polar_binary_imgs = np.reshape(polar_binary_imgs , (data.shape[0], np.prod(data.shape[1:])))
+    # All the images of a chunk are normalized at once, using per-image min/max/mean
+    for start in range(0, N, chunk_sz):
+        curr_data = flat_data[start:start+chunk_sz].astype(np.float64)
+        minData = np.min(curr_data, axis=1, keepdims=True)
+        maxData = np.max(curr_data, axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            curr_data -= minData
+            curr_data /= maxData - minData
+        curr_data -= np.mean(curr_data, axis=1, keepdims=True)
 
-    return polar_binary_imgs
+        out[start:start+chunk_sz] = np.where(curr_data >= 0, 1, off_value)
 
+    return out
 
 
 def vec2img(feat_vecs, width, height):
@@ -87,13 +170,10 @@ def vec2img(feat_vecs, width, height):
     Returns:
     -----------
     ndarray. shape=(N, height, width).
-        Inflated version of `feat_vecs` into images
+        Inflated version of `feat_vecs` into images. This is a view of `feat_vecs` (no copy) with
+        the same dtype.
     '''
-    N = feat_vecs.shape[0]
-    imgs = np.zeros((feat_vecs.shape[0],height,width))
-    for i in range(N):
-        imgs[i,:,:] = feat_vecs[i,:].reshape(height,width)
-    return imgs
+    return feat_vecs.reshape(feat_vecs.shape[0], height, width)
 
 
 def recall_error(orig_data, recovered_data, tol=0.5):
@@ -103,7 +183,7 @@ def recall_error(orig_data, recovered_data, tol=0.5):
     Parameters:
     -----------
     orig_data: ndarray. shape=(N, height*width).
-        1D feature vectors used to train network
+        1D feature vectors used to train network (any dtype, e.g. int8)
     recovered_data: ndarray. shape=(N, height*width).
         1D vectors of recovered memories from trained network
 
@@ -111,7 +191,7 @@ def recall_error(orig_data, recovered_data, tol=0.5):
     -----------
     float. error rate, a proportion between 0 and 1, of how many vector components are mismatched.
     '''
-    errorCount = np.sum( orig_data != recovered_data) #check for false, sum 
+    errorCount = np.count_nonzero(orig_data != recovered_data) #check for false, sum 
     totalCount = orig_data.shape[0] * orig_data.shape[1]
     errorRate = errorCount / totalCount
 
@@ -4,10 +4,232 @@ CS443: Computational Neuroscience
 YOUR NAMES HERE
 Project 3: Competitive Networks
 '''
+import hashlib
+from collections import OrderedDict
 import numpy as np
+from scipy import ndimage, signal, sparse
+from scipy import integrate as ivp
 
+# Solvers with error control (scipy.integrate). The embedded Runge-Kutta pairs are explicit, the
+# others are implicit and suited to stiff regimes (e.g. sharp winner-take-all transitions).
+ADAPTIVE_METHODS = ('RK23', 'RK45', 'DOP853')
+STIFF_METHODS = ('Radau', 'BDF', 'LSODA')
 
-def leaky_integrator(I, A, B, t_max, dt):
+# Kernels at least this long are applied with FFT convolution instead of direct convolution
+FFT_MIN_KER_SZ = 64
+# Number of convolved drives kept by `gaussian_drive` (least recently used ones are dropped)
+DRIVE_CACHE_SIZE = 32
+_drive_cache = OrderedDict()
+
+
+def integrate(rhs, x0, t_max, dt, record='full', stride=1, out=None, tol=None, unit_ndim=1,
+              return_info=False, method='euler', rtol=1e-6, atol=1e-9, coupled=True):
+    '''Integrates the network ODE dx/dt = rhs(t, x) from x(0) = `x0`, by default with Euler's
+    Method. Shared by all the simulators in this file.
+
+    Parameters:
+    -----------
+    rhs: callable. rhs(t, x) returns dx/dt for the state `x` at time `t`. It must work on the
+        whole state array at once (vectorized), including a leading batch dimension.
+    x0: ndarray. shape=(N,) or shape=(batch, N) (or any other shape).
+        Initial state. With a batch dimension, every input vector is simulated in the same pass.
+    t_max: float.
+        Maximum time ("real continuous time", not time steps) to simulate the network > 0.
+    dt: float.
+        Integration time step > 0. With an adaptive `method`, the spacing of the output time grid
+        (the solver picks its own steps and interpolates the state at the grid times).
+    record: str. Which time steps are kept. Options are:
+        'full': every `stride`-th time step (all of them when `stride`=1).
+        'final': only the final time step.
+    stride: int. Keep every `stride`-th time step when `record`='full'.
+    out: None, ndarray, or str. Where the recorded time steps are written.
+        None: allocate a new array.
+        ndarray: preallocated array (or np.memmap) with the shape of the result.
+        str: path of a .npy file that is created and memory-mapped, so that long simulations are
+            streamed to disk (see np.lib.format.open_memmap).
+    tol: float or None. If given, stop integrating (before `t_max`) once every network in the
+        batch has converged: max_i |dx_i/dt| < `tol`.
+    unit_ndim: int. Number of trailing dimensions of `x0` that index units (1 for a 1D network,
+        2 for an image). The leading dimensions are batch dimensions.
+    return_info: boolean. Also return a dict with information about the simulation.
+    method: str. Integration method. Options are:
+        'euler': fixed-step Euler's Method.
+        'RK23', 'RK45', 'DOP853': explicit embedded Runge-Kutta pairs with error control.
+        'Radau', 'BDF', 'LSODA': implicit methods for stiff parameter regimes.
+    rtol, atol: floats. Relative and absolute error tolerances of the adaptive methods.
+    coupled: boolean. Whether units in the same network interact through x in `rhs` (e.g. the
+        recurrent feedback of the RCF). If False, each unit's dx/dt only depends on its own x,
+        so the Jacobian of the implicit methods is diagonal and cheap to estimate.
+
+    Returns:
+    -----------
+    ndarray. shape=(n_recorded, *x0.shape).
+        The state at the recorded time steps. The time steps are t = 0, dt, 2*dt, ..., t_max, so
+        with `record`='full' and `stride`=1 there are n_steps = round(t_max/dt) + 1 of them.
+        When integration stops early, only the time steps up to the stop are there ('final'
+        keeps the state at the stop).
+    dict. Only if `return_info` is True. Has the keys:
+        't_conv': ndarray. shape=batch shape of `x0`. Time at which each network first had
+            max_i |dx_i/dt| < `tol` (NaN if it did not, or if `tol` is None). Adaptive methods
+            check this at the end of each of their steps.
+        'n_steps': int. Number of integration steps taken.
+        'nfev': int. Number of evaluations of `rhs`.
+    '''
+    x = np.array(x0, dtype=float)
+    n_steps = int(round(t_max/dt))
+    if record == 'full':
+        rec_steps = np.arange(0, n_steps + 1, stride)
+    elif record == 'final':
+        rec_steps = np.array([n_steps])
+    else:
+        raise ValueError(f'Unknown record mode {record}. Options are full, final')
+
+    shape = (len(rec_steps),) + x.shape
+    if out is None:
+        out = np.empty(shape)
+    elif isinstance(out, str):
+        out = np.lib.format.open_memmap(out, mode='w+', dtype=float, shape=shape)
+    elif out.shape != shape:
+        raise ValueError(f'out has shape {out.shape}, expected {shape}')
+
+    t_conv = np.full(x.shape[:x.ndim - unit_ndim], np.nan)
+    unit_axes = tuple(range(x.ndim - unit_ndim, x.ndim))
+
+    def converged(t, dxdt):
+        '''Records the networks that converge at time `t`. Returns whether they all have.'''
+        t_conv[np.isnan(t_conv) & (np.max(np.abs(dxdt), axis=unit_axes) < tol)] = t
+        return not np.any(np.isnan(t_conv))
+
+    if method in ADAPTIVE_METHODS + STIFF_METHODS:
+        r, step, nfev = _integrate_adaptive(rhs, x, rec_steps*dt, n_steps*dt, out, tol, converged,
+                                            method, rtol, atol, unit_ndim if coupled else 0)
+        if record == 'final' and r == 0:
+            r = 1
+    elif method == 'euler':
+        r = nfev = 0
+        for step in range(n_steps + 1):
+            stop = step == n_steps
+            if tol is not None or not stop:
+                dxdt = rhs(step*dt, x)
+                nfev += 1
+            if tol is not None:
+                stop = converged(step*dt, dxdt) or stop
+
+            if (r < len(rec_steps) and step == rec_steps[r]) or (stop and record == 'final'):
+                out[r] = x
+                r += 1
+            if stop:
+                break
+            x += dt*dxdt
+    else:
+        raise ValueError(f'Unknown integration method {method}. Options are euler, '
+                         f'{", ".join(ADAPTIVE_METHODS + STIFF_METHODS)}')
+
+    out = out[:r]
+    if return_info:
+        return out, {'t_conv': t_conv, 'n_steps': step, 'nfev': nfev}
+    return out
+
+
+def _integrate_adaptive(rhs, x, t_rec, t_end, out, tol, converged, method, rtol, atol,
+                        coupled_ndim):
+    '''Integrates with one of the scipy.integrate ODE solvers, step by step, so that convergence
+    can be checked after every step. The state at the times `t_rec` is interpolated with the
+    solver's dense output and written to `out`. When integration stops early, the state at the
+    stop is written to the next row of `out` (used by record='final').
+
+    `coupled_ndim` is the number of trailing dimensions of `x` whose units interact: the
+    Jacobian is block diagonal with blocks of that many units (diagonal when 0).
+
+    Returns:
+    -----------
+    int. Number of rows of `out` that were written.
+    int. Number of solver steps.
+    int. Number of evaluations of `rhs`.
+    '''
+    shape = x.shape
+    nfev = 0
+
+    def fun(t, y):
+        nonlocal nfev
+        nfev += 1
+        return rhs(t, y.reshape(shape)).ravel()
+
+    kwargs = {}
+    if method in ('Radau', 'BDF'):
+        block = int(np.prod(shape[len(shape) - coupled_ndim:]))
+        kwargs['jac_sparsity'] = sparse.kron(sparse.identity(x.size // block),
+                                             np.ones((block, block)), format='csc')
+    solver = getattr(ivp, method)(fun, 0.0, x.ravel(), t_end, rtol=rtol, atol=atol, **kwargs)
+
+    r = int(np.searchsorted(t_rec, 0.0, side='right'))
+    out[:r] = x
+    stop = tol is not None and converged(0.0, fun(0.0, solver.y).reshape(shape))
+    step = 0
+    while not stop and solver.status == 'running':
+        msg = solver.step()
+        step += 1
+        if solver.status == 'failed':
+            raise RuntimeError(f'{method} failed at t={solver.t}: {msg}')
+        if tol is not None:
+            stop = converged(solver.t, fun(solver.t, solver.y).reshape(shape))
+
+        hi = len(t_rec) if solver.status == 'finished' else \
+            int(np.searchsorted(t_rec, solver.t, side='right'))
+        if hi > r:
+            interp = solver.dense_output()(t_rec[r:hi])  # shape=(x.size, hi - r)
+            out[r:hi] = np.moveaxis(interp, -1, 0).reshape((-1,) + shape)
+            r = hi
+
+    if stop and r < len(out):
+        out[r] = solver.y.reshape(shape)
+    return r, step, nfev
+
+
+def _simulate(rhs, x0, t_max, dt, record, stride, out, mode, tol, return_info, method, rtol, atol,
+              steady_state=None, unit_ndim=1, coupled=False):
+    '''Runs a simulator in one of the modes:
+        'integrate': integrate all the way to `t_max` (see `integrate`).
+        'early_stop': integrate until max_i |dx_i/dt| < `tol` (or `t_max`).
+        'steady_state': skip integration and return the closed-form equilibrium.
+
+    `steady_state` is None or (drive, rate) for networks that follow dx/dt = drive - rate*x from
+    x(0) = 0 with a constant drive and rate. The equilibrium is then x = drive/rate, and
+    |dx/dt| = |drive|*exp(-rate*t) falls below `tol` at t = ln(|drive|/tol)/rate.
+    '''
+    if mode == 'steady_state':
+        if steady_state is None:
+            raise ValueError('This network does not have a closed-form steady state')
+        drive, rate = np.broadcast_arrays(*steady_state)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_eq = np.where(rate > 0, drive / np.where(rate > 0, rate, 1), 0)
+            t_unit = np.where((np.abs(drive) > tol) & (rate > 0),
+                              np.log(np.abs(drive)/tol) / rate, 0)
+        t_unit = np.where((np.abs(drive) > tol) & (rate <= 0), np.inf, t_unit)
+        unit_axes = tuple(range(x_eq.ndim - unit_ndim, x_eq.ndim))
+
+        hist = x_eq[np.newaxis]
+        if out is not None:
+            out = np.lib.format.open_memmap(out, mode='w+', dtype=float, shape=hist.shape) \
+                if isinstance(out, str) else out
+            out[...] = hist
+            hist = out
+        info = {'t_conv': np.max(t_unit, axis=unit_axes), 'n_steps': 0, 'nfev': 0}
+    elif mode in ('integrate', 'early_stop'):
+        hist, info = integrate(rhs, x0, t_max, dt, record, stride, out,
+                               tol=tol if mode == 'early_stop' else None, unit_ndim=unit_ndim,
+                               return_info=True, method=method, rtol=rtol, atol=atol,
+                               coupled=coupled)
+    else:
+        raise ValueError(f'Unknown mode {mode}. Options are integrate, early_stop, steady_state')
+
+    if return_info:
+        return hist, info
+    return hist
+
+
+def leaky_integrator(I, A, B, t_max, dt, record='full', stride=1, out=None, mode='integrate',
+                     tol=1e-6, return_info=False, method='euler', rtol=1e-6, atol=1e-9):
     '''A layer of leaky integrator neurons with shunting excitation.
 
     Uses Euler's Method for numerical integration.
@@ -26,56 +248,52 @@ def leaky_integrator(I, A, B, t_max, dt):
     dt: float.
         Integration time step > 0.
 
+    record, stride, out: See `integrate`.
+    mode: str. How the network is simulated. Options are:
+        'integrate': integrate all the way to `t_max`.
+        'early_stop': stop integrating once max_i |dx_i/dt| < `tol`.
+        'steady_state': return the closed-form equilibrium (shape=(1, ...)) without integrating.
+    tol: float. Convergence tolerance on max_i |dx_i/dt| ('early_stop' and 'steady_state').
+    return_info: boolean. Also return a dict with the time-to-convergence of each network
+        ('t_conv') and the number of integration steps taken ('n_steps'). See `integrate`.
+    method, rtol, atol: Integration method and error tolerances of the adaptive methods.
+        See `integrate`.
+
     Returns:
     -----------
     ndarray. shape=(n_steps, N).
         Each unit in the network's activation at all the integration time steps.
+        If `I` has shape=(batch, N), shape=(n_steps, batch, N).
     '''
-    currActs=[]
-
-    while dt < t_max:
-        x_i= []
-        for i in range(I.shape[0]):
-
-            x_i[dt] = x_i[dt-1] + dt*fx
-            #print("I:", I )
-            test = I[i]*(B-x_i[dt])
-            #print("test:", test )
-
-            fx = [x + (A*x_i[dt]) for x in test]
-
-            x_i.append(fx)
-            #print("netAct:", netAct )
-
-        currActs.append(x_i)
-
-    netActs = np.array(currActs)
+    I = np.asarray(I, dtype=float)
 
-    return netActs
+    def rhs(t, x):
+        return -A*x + (B - x)*I
 
+    # Equilibrium: x = B*I / (A + I)
+    return _simulate(rhs, np.zeros_like(I), t_max, dt, record, stride, out, mode, tol, return_info,
+                     method, rtol, atol, steady_state=(B*I, A + I))
 
 
-def sum_not_I(I):
+def sum_not_I(I, axis=None):
     '''Sums all the other elements in `I` across all dimensions except for the one in each position
 
     Parameters:
     -----------
     I: ndarray. shape=(anything).
         Input vector in any number of dimensions
+    axis: None or int. If given, only sum across this axis (e.g. -1 for a batch of input vectors).
 
     Returns:
     -----------
     ndarray. shape=shape(I).
     '''
-    arr = np.zeros(size(I))
-    total_sum = np.sum(I)
-    for i range(np.prod(A.shape))
-        arr[i] = total_sum - I[i]
+    I = np.asarray(I)
+    return np.sum(I, axis=axis, keepdims=axis is not None) - I
 
-    return arr 
 
-
-def lateral_inhibition(I, A, B, t_max, dt):
+def lateral_inhibition(I, A, B, t_max, dt, record='full', stride=1, out=None, mode='integrate',
+                       tol=1e-6, return_info=False, method='euler', rtol=1e-6, atol=1e-9):
     '''Shunting network with lateral inhibition
 
     Parameters:
@@ -91,16 +309,109 @@ def lateral_inhibition(I, A, B, t_max, dt):
         Maximum time ("real continuous time", not time steps) to simulate the network > 0.
     dt: float.
         Integration time step > 0.
+    record, stride, out: See `integrate`.
+    mode: str. How the network is simulated. Options are:
+        'integrate': integrate all the way to `t_max`.
+        'early_stop': stop integrating once max_i |dx_i/dt| < `tol`.
+        'steady_state': return the closed-form equilibrium (shape=(1, ...)) without integrating.
+    tol: float. Convergence tolerance on max_i |dx_i/dt| ('early_stop' and 'steady_state').
+    return_info: boolean. Also return a dict with the time-to-convergence of each network
+        ('t_conv') and the number of integration steps taken ('n_steps'). See `integrate`.
+    method, rtol, atol: Integration method and error tolerances of the adaptive methods.
+        See `integrate`.
 
     Returns:
     -----------
     ndarray. shape=(n_steps, N).
         Each unit in the network's activation at all the integration time steps.
+        If `I` has shape=(batch, N), shape=(n_steps, batch, N).
     '''
-    pass
+    I = np.asarray(I, dtype=float)
+    inhib = sum_not_I(I, axis=-1)
+
+    def rhs(t, x):
+        return -A*x + (B - x)*I - x*inhib
+
+    # Equilibrium: x = B*I / (A + sum(I))
+    return _simulate(rhs, np.zeros_like(I), t_max, dt, record, stride, out, mode, tol, return_info,
+                     method, rtol, atol, steady_state=(B*I, A + I + inhib))
+
 
+def gaussian_kernel(kerSz, sigma):
+    '''Makes a 1D Gaussian kernel that sums to 1.
+
+    Parameters:
+    -----------
+    kerSz: int.
+        Length of the kernel. The samples are `kerSz` equally spaced points between
+        -(`kerSz`-1)/2 and (`kerSz`-1)/2.
+    sigma: float.
+        Standard deviation of the Gaussian.
 
-def dist_dep_net(I, A, B, C, e_sigma, i_sigma, kerSz, t_max, dt):
+    Returns:
+    -----------
+    ndarray. shape=(kerSz,).
+    '''
+    pts = np.linspace(-(kerSz - 1)/2, (kerSz - 1)/2, kerSz)
+    ker = np.exp(-pts**2 / (2*sigma**2))
+    return ker / np.sum(ker)
+
+
+def gaussian_drive(I, sigma, kerSz, ndim=1, cache=True):
+    '''Convolves the input with a Gaussian kernel ('same' boundary conditions), which gives the
+    excitatory or inhibitory drive of a distance-dependent network.
+
+    A `ndim`-D Gaussian is the outer product of 1D Gaussians, so it is applied as `ndim` separable
+    1D passes (O(kerSz) instead of O(kerSz**ndim) per unit). Kernels of length >= FFT_MIN_KER_SZ
+    use FFT convolution. Since the input does not change over time, the drive is computed once per
+    simulation, and the last DRIVE_CACHE_SIZE drives are cached across calls.
+
+    Parameters:
+    -----------
+    I: ndarray. shape=(..., N) for ndim=1 or shape=(..., img_height, img_width) for ndim=2.
+        Input(s). Leading dimensions are batch dimensions.
+    sigma: float.
+        Standard deviation of the Gaussian.
+    kerSz: int.
+        Length of the kernel along each dimension.
+    ndim: int. Number of trailing dimensions of `I` that are convolved.
+    cache: boolean. Whether to look up and store the drive in the cache.
+
+    Returns:
+    -----------
+    ndarray. shape=shape(I). Read-only when it comes from the cache.
+    '''
+    I = np.asarray(I, dtype=float)
+    if cache:
+        key = (hashlib.sha1(np.ascontiguousarray(I).data).hexdigest(), I.shape, float(sigma),
+               int(kerSz), ndim)
+        if key in _drive_cache:
+            _drive_cache.move_to_end(key)
+            return _drive_cache[key]
+
+    ker = gaussian_kernel(kerSz, sigma)
+    drive = I
+    for axis in range(I.ndim - ndim, I.ndim):
+        if kerSz >= FFT_MIN_KER_SZ:
+            shape = [1]*I.ndim
+            shape[axis] = kerSz
+            drive = signal.fftconvolve(drive, ker.reshape(shape), mode='same', axes=axis)
+        else:
+            # Zero padding, and the origin shift centers even-length kernels like 'same' does
+            drive = ndimage.convolve1d(drive, ker, axis=axis, mode='constant', cval=0.0,
+                                       origin=-1 if kerSz % 2 == 0 else 0)
+
+    if cache:
+        drive.flags.writeable = False
+        _drive_cache[key] = drive
+        if len(_drive_cache) > DRIVE_CACHE_SIZE:
+            _drive_cache.popitem(last=False)
+    return drive
+
+
+def dist_dep_net(I, A, B, C, e_sigma, i_sigma, kerSz, t_max, dt, record='full', stride=1,
+                 out=None, mode='integrate', tol=1e-6, return_info=False, method='euler',
+                 rtol=1e-6, atol=1e-9):
     '''Distant-dependent (convolutional) 1D shunting network
 
     Parameters:
@@ -124,11 +435,22 @@ def dist_dep_net(I, A, B, C, e_sigma, i_sigma, kerSz, t_max, dt):
         Maximum time ("real continuous time", not time steps) to simulate the network > 0.
     dt: float.
         Integration time step > 0.
+    record, stride, out: See `integrate`.
+    mode: str. How the network is simulated. Options are:
+        'integrate': integrate all the way to `t_max`.
+        'early_stop': stop integrating once max_i |dx_i/dt| < `tol`.
+        'steady_state': return the closed-form equilibrium (shape=(1, ...)) without integrating.
+    tol: float. Convergence tolerance on max_i |dx_i/dt| ('early_stop' and 'steady_state').
+    return_info: boolean. Also return a dict with the time-to-convergence of each network
+        ('t_conv') and the number of integration steps taken ('n_steps'). See `integrate`.
+    method, rtol, atol: Integration method and error tolerances of the adaptive methods.
+        See `integrate`.
 
     Returns:
     -----------
     ndarray. shape=(n_steps, N).
         Each unit in the network's activation at all the integration time steps.
+        If `I` has shape=(batch, N), shape=(n_steps, batch, N).
 
     TODO:
     - Create two small 1D Gaussian kernels (shape of each =(kerSz,)) with different sigma values
@@ -144,10 +466,22 @@ def dist_dep_net(I, A, B, C, e_sigma, i_sigma, kerSz, t_max, dt):
     NOTE: You may either write your own convolution code (e.g. based on last semester) or use
     the built-in one in scipy.
     '''
-    pass
+    I = np.asarray(I, dtype=float)
+    # The input does not change over time, so the convolved drives are computed once
+    excit = gaussian_drive(I, e_sigma, kerSz)
+    inhib = gaussian_drive(I, i_sigma, kerSz)
+
+    def rhs(t, x):
+        return -A*x + (B - x)*excit - (C + x)*inhib
+
+    # Equilibrium: x = (B*E - C*S) / (A + E + S)
+    return _simulate(rhs, np.zeros_like(I), t_max, dt, record, stride, out, mode, tol, return_info,
+                     method, rtol, atol, steady_state=(B*excit - C*inhib, A + excit + inhib))
 
 
-def dist_dep_net_image(I, A, i_sigma, kerSz, t_max, dt):
+def dist_dep_net_image(I, A, i_sigma, kerSz, t_max, dt, record='full', stride=1, out=None,
+                       mode='integrate', tol=1e-6, return_info=False, method='euler',
+                       rtol=1e-6, atol=1e-9):
     '''Distant-dependent (convolutional) 2D shunting network
 
     NOTE: If the network simulation is too slow on your machine (e.g. you are using very large images),
@@ -155,8 +489,8 @@ def dist_dep_net_image(I, A, i_sigma, kerSz, t_max, dt):
 
     Parameters:
     -----------
-    I: ndarray. shape=(N, img_height, img_width).
-        Input vector (assumed to not vary with time here).
+    I: ndarray. shape=(img_height, img_width) or shape=(N, img_height, img_width).
+        Input image(s) (assumed to not vary with time here).
     A: float.
         Passive decay rate >= 0.
     i_sigma: float.
@@ -167,11 +501,23 @@ def dist_dep_net_image(I, A, i_sigma, kerSz, t_max, dt):
         Maximum time ("real continuous time", not time steps) to simulate the network > 0.
     dt: float.
         Integration time step > 0.
+    record, stride, out: See `integrate`. record='final' only keeps the final time step.
+    mode: str. How the network is simulated. Options are:
+        'integrate': integrate all the way to `t_max`.
+        'early_stop': stop integrating once max_i |dx_i/dt| < `tol`.
+        'steady_state': return the closed-form equilibrium (shape=(1, ...)) without integrating.
+            x = I / (A + S*I) needs a single convolution, which makes large images practical.
+    tol: float. Convergence tolerance on max_i |dx_i/dt| ('early_stop' and 'steady_state').
+    return_info: boolean. Also return a dict with the time-to-convergence of each network
+        ('t_conv') and the number of integration steps taken ('n_steps'). See `integrate`.
+    method, rtol, atol: Integration method and error tolerances of the adaptive methods.
+        See `integrate`.
 
     Returns:
     -----------
     ndarray. shape=(n_steps, img_height, img_width).
         Each unit in the network's activation at all the integration time steps.
+        With N images, shape=(n_steps, N, img_height, img_width).
         NOTE: If you have issues holding all the time steps in memory, you can just return the return
         at the final time step.
 
@@ -189,10 +535,45 @@ def dist_dep_net_image(I, A, i_sigma, kerSz, t_max, dt):
     NOTE: You may either write your own convolution code (e.g. based on last semester) or use
     the built-in one in scipy.
     '''
-    pass
+    I = np.asarray(I, dtype=float)
+    inhib = gaussian_drive(I, i_sigma, kerSz, ndim=2)
 
+    def rhs(t, x):
+        return -A*x + I - x*inhib
 
-def rcf(I, A, B, fun_str, t_max, dt, F=0):
+    return _simulate(rhs, np.zeros_like(I), t_max, dt, record, stride, out, mode, tol, return_info,
+                     method, rtol, atol, steady_state=(I, A + inhib), unit_ndim=2)
+
+
+def signal_fun(x, fun_str, F=0):
+    '''Recurrent feedback (signal) function of the RCF.
+
+    Parameters:
+    -----------
+    x: ndarray. Unit activations.
+    fun_str: str.
+        'linear', 'faster_than_linear', 'slower_than_linear', 'sigmoid'
+    F: float.
+        Parameter in slower-than-linear and sigmoid functions that controls inflection point > 0.
+
+    Returns:
+    -----------
+    ndarray. shape=shape(x).
+    '''
+    if fun_str == 'linear':
+        return x
+    elif fun_str == 'faster_than_linear':
+        return x**2
+    elif fun_str == 'slower_than_linear':
+        return x / (F + x)
+    elif fun_str == 'sigmoid':
+        return x**2 / (F + x**2)
+    raise ValueError(f'Unknown signal function {fun_str}. Options are linear, faster_than_linear, '
+                     'slower_than_linear, sigmoid')
+
+
+def rcf(I, A, B, fun_str, t_max, dt, F=0, record='full', stride=1, out=None, mode='integrate',
+        tol=1e-6, return_info=False, method='euler', rtol=1e-6, atol=1e-9):
     '''Recurrent competitive field network
 
     Parameters:
@@ -213,10 +594,26 @@ def rcf(I, A, B, fun_str, t_max, dt, F=0):
         Integration time step > 0.
     F: float.
         Parameter in slower-than-linear and sigmoid functions that controls inflection point > 0.
+    record, stride, out: See `integrate`.
+    mode: str. 'integrate' (all the way to `t_max`) or 'early_stop' (stop once
+        max_i |dx_i/dt| < `tol`). The RCF has no closed-form steady state.
+    tol, return_info: See `leaky_integrator`.
+    method, rtol, atol: Integration method and error tolerances of the adaptive methods.
+        See `integrate`. Faster-than-linear feedback gives sharp transitions where an adaptive
+        or stiff `method` saves many small fixed steps.
 
     Returns:
     -----------
     ndarray. shape=(n_steps, N).
         Each unit in the network's activation at all the integration time steps.
+        If `I` has shape=(batch, N), shape=(n_steps, batch, N).
     '''
-    pass
+    I = np.asarray(I, dtype=float)
+    signal_fun(I, fun_str, F)  # check fun_str before integrating
+
+    def rhs(t, x):
+        fx = signal_fun(x, fun_str, F)
+        return -A*x + (B - x)*fx - x*sum_not_I(fx, axis=-1)
+
+    return _simulate(rhs, I, t_max, dt, record, stride, out, mode, tol, return_info, method, rtol,
+                     atol, coupled=True)
@@ -0,0 +1,85 @@
+'''experiments.py
+Parameter sweeps of the competitive networks
+CS443: Computational Neuroscience
+YOUR NAMES HERE
+Project 3: Competitive Networks
+'''
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import competitive_nets
+
+
+def _run_rcf_group(args):
+    '''Simulates one chunk of RCF grid points that share a signal function, as a single batch.
+    Top-level function so that it can be sent to worker processes.
+    '''
+    I, A, B, F, fun_str, t_max, dt, sim_kwargs = args
+    # Parameters of shape=(batch, 1) broadcast against the batch of input vectors
+    return competitive_nets.rcf(I, A[:, np.newaxis], B[:, np.newaxis], fun_str, t_max, dt,
+                                F=F[:, np.newaxis], record='final', **sim_kwargs)[-1]
+
+
+def rcf_sweep(inputs, A, B, fun_str, F=(0.0,), t_max=10, dt=0.01, quench_tol=1e-3,
+              chunk_sz=4096, workers=None, **sim_kwargs):
+    '''Simulates the RCF over the grid of (signal function x input x A x B x F).
+
+    Grid points with the same signal function are stacked along the batch dimension and run as
+    vectorized simulations (in chunks of at most `chunk_sz` grid points). Chunks run in a
+    process pool.
+
+    Parameters:
+    -----------
+    inputs: ndarray. shape=(num_inputs, N). Input vectors.
+    A: iterable of floats. Passive decay rates.
+    B: iterable of floats. Excitatory upper bounds.
+    fun_str: iterable of strs. Signal functions (see `competitive_nets.signal_fun`).
+    F: iterable of floats. Inflection point parameters of the slower-than-linear and sigmoid
+        signal functions.
+    t_max, dt: floats. See `competitive_nets.rcf`.
+    quench_tol: float. Activity is quenched when all the final activations are < `quench_tol`.
+    chunk_sz: int. Maximum number of grid points simulated together.
+    workers: int or None. Number of worker processes. None uses all the CPUs, 1 runs everything
+        in the current process.
+    sim_kwargs: Keyword arguments passed to `competitive_nets.rcf` (e.g. mode, tol, method).
+
+    Returns:
+    -----------
+    dict of ndarrays. One row per grid point, with the columns
+        'fun_str', 'input' (index in `inputs`), 'A', 'B', 'F',
+        'x': shape=(num_rows, N). Final activations,
+        'winner': index of the most active unit (-1 when quenched),
+        'total': total final activity normalized by B,
+        'quenched': whether activity was quenched.
+        (pandas.DataFrame with the 'x' column left out turns it into a data frame.)
+    '''
+    inputs = np.asarray(inputs, dtype=float)
+    fun_str = list(fun_str)
+    params = np.array(list(itertools.product(range(len(inputs)), A, B, F)), dtype=float)
+    params = params.reshape(-1, 4)
+
+    tasks = []
+    for fun in fun_str:
+        for start in range(0, len(params), chunk_sz):
+            inds, a, b, f = params[start:start + chunk_sz].T
+            tasks.append((inputs[inds.astype(int)], a, b, f, fun, t_max, dt, sim_kwargs))
+    if workers == 1:
+        finals = list(map(_run_rcf_group, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            finals = list(pool.map(_run_rcf_group, tasks))
+
+    x = np.concatenate(finals)
+    quenched = np.max(x, axis=1) < quench_tol
+    columns = np.tile(params, (len(fun_str), 1)).T
+    return {'fun_str': np.repeat(np.array(fun_str), len(params)),
+            'input': columns[0].astype(int),
+            'A': columns[1],
+            'B': columns[2],
+            'F': columns[3],
+            'x': x,
+            'winner': np.where(quenched, -1, np.argmax(x, axis=1)),
+            'total': np.sum(x, axis=1) / columns[2],
+            'quenched': quenched}
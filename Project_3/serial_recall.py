@@ -0,0 +1,174 @@
+'''serial_recall.py
+Competitive queuing (CQ) model of serial recall from working memory
+CS443: Computational Neuroscience
+YOUR NAMES HERE
+Project 3: Competitive Networks
+'''
+import os
+import warnings
+import numpy as np
+
+from competitive_nets import signal_fun, sum_not_I
+
+
+def load_primacy_gradients(path=os.path.join(os.path.dirname(__file__), 'primacy_gradients.csv')):
+    '''Loads STORE2 primacy gradients, one list per line of a csv file (line n has n values).
+
+    Parameters:
+    -----------
+    path: str. Path of the csv file.
+
+    Returns:
+    -----------
+    list of ndarrays. The gradient of each list, in serial order.
+    '''
+    with open(path) as f:
+        return [np.array(line.split(','), dtype=float) for line in f.read().split()]
+
+
+def go_signal(t, t_go, pauses=None):
+    '''The GO signal J of a batch of recall schedules at time `t`.
+
+    Parameters:
+    -----------
+    t: float. Current time.
+    t_go: ndarray. shape=(batch,). Time at which each GO signal turns on.
+    pauses: ndarray or None. shape=(batch, num_pauses, 2). (start, end) times of intervals during
+        which the GO signal is off again. Unused pauses can be set to NaN.
+
+    Returns:
+    -----------
+    ndarray. shape=(batch, 1). 1 where the GO signal is on and 0 where it is off.
+    '''
+    on = t >= t_go
+    if pauses is not None:
+        on &= ~np.any((pauses[..., 0] <= t) & (t < pauses[..., 1]), axis=1)
+    return on[:, np.newaxis].astype(float)
+
+
+def cq_recall(gradients, t_max=100, dt=0.01, t_go=1.0, pauses=None, trials=1, noise=0.0, seed=0,
+              A_x=1, B_x=2, D=20, eps=1e-3, A_y=1, B_y=1.5, C_y=30, A_w=0.01, B_w=1, gamma=0.4):
+    '''Simulates serial recall of many lists (and trials) at once with the competitive queuing
+    network, without keeping the trajectories.
+
+    The network has three layers of N units (one per list item). The working memory layer x
+    starts with the primacy gradient, the RCF layer y has a faster-than-linear signal function
+    (winner-take-all) and the inhibitory interneurons w suppress recalled items:
+        dx_i/dt = -A_x*x_i + (B_x - x_i)*f(x_i) - x_i*(sum_{j!=i} x_j + D*w_i)
+        dy_i/dt = -A_y*y_i + (B_y - y_i)*(g(y_i) + J*n*x_i) - (C_y + y_i)*sum_{j!=i} g(y_j)
+        dw_i/dt = -A_w*w_i + (B_w - w_i)*max(y_i - gamma, 0)
+    where J is the GO signal, n is the number of items in the list, f(x_i) = x_i / (eps + sum_j x_j)
+    and g(y) = max(y, 0)**2. The gradient sums to about 1, so n*x has an average of about 1 for
+    any list length. Without the factor n the drive of every item shrinks as lists get longer
+    and no RCF unit reaches `gamma` past 8 items.
+    NOTE: f is the normalized signal x_i/(eps + sum_j x_j) rather than 1/(eps + sum_j x_j), which
+    drives every x_i to the same value and erases the gradient before the GO signal.
+
+    An item is recalled when its RCF unit first exceeds `gamma`. Recalled working memory units are
+    tagged and held at 0 from then on. The default parameters recall all the lists of
+    primacy_gradients.csv (1-10 items) in order, and longer primacy gradients too (e.g. 30 items
+    decaying by 10% per position, with `t_max` long enough). A warning is raised when lists are
+    not fully recalled by `t_max`.
+
+    The three layers of all the lists are one state array, shape=(3, batch, N_max), integrated
+    with Euler's Method. Shorter lists are padded with units that are held at 0.
+
+    Parameters:
+    -----------
+    gradients: list of array-likes. Primacy gradient of each list (any lengths). Each gradient is
+        normalized to sum to 1 before it becomes the initial x.
+    t_max: float. Maximum time to simulate. Simulation stops early once every list is recalled.
+    dt: float. Integration time step.
+    t_go: float or ndarray. shape=(batch,). Time(s) at which the GO signal turns on.
+        batch = len(`gradients`)*`trials`, ordered list by list (all trials of list 0 first).
+    pauses: None, array-like shape=(num_pauses, 2) for every list, or ndarray
+        shape=(batch, num_pauses, 2). (start, end) times during which the GO signal is off. See
+        `go_signal`.
+    trials: int. Number of trials of each list.
+    noise: float. Standard deviation of the multiplicative Gaussian noise on the initial gradient
+        of each trial (0 makes all trials identical).
+    seed: int. Seed of the noise.
+    A_x, B_x, D, eps, A_y, B_y, C_y, A_w, B_w, gamma: floats. Network parameters (see above).
+
+    Returns:
+    -----------
+    dict of ndarrays. One row per (list, trial), with the columns
+        'list': index of the list in `gradients`,
+        'trial': trial number,
+        'length': number of items in the list,
+        'order': shape=(batch, N_max). Item recalled at each recall position (-1 when none),
+        'onset': shape=(batch, N_max). Time of each recall (NaN when none),
+        'num_recalled': number of recalled items,
+        'correct': whether the whole list was recalled in serial order.
+    '''
+    num_lists = len(gradients)
+    lengths = np.repeat([len(g) for g in gradients], trials)
+    batch, N = len(lengths), max(lengths)
+    items = lengths[:, np.newaxis] > np.arange(N)
+
+    x0 = np.zeros((num_lists, N))
+    for k, g in enumerate(gradients):
+        x0[k, :len(g)] = g
+    x0 = np.repeat(x0, trials, axis=0)
+    if noise > 0:
+        rng = np.random.default_rng(seed)
+        x0 *= np.maximum(1 + noise*rng.standard_normal(x0.shape), 0)
+    x0 /= np.sum(x0, axis=1, keepdims=True)
+
+    t_go = np.broadcast_to(np.asarray(t_go, dtype=float), (batch,))
+    if pauses is not None:
+        pauses = np.asarray(pauses, dtype=float)
+        pauses = np.broadcast_to(pauses, (batch,) + pauses.shape[-2:])
+
+    # Drive of the RCF layer scaled by the list length (see above)
+    drive_gain = lengths[:, np.newaxis].astype(float)
+
+    state = np.zeros((3, batch, N))
+    x, y, w = state
+    x[...] = x0
+    active = items.copy()  # working memory units that have not been recalled
+
+    order = np.full((batch, N), -1)
+    onset = np.full((batch, N), np.nan)
+    num_recalled = np.zeros(batch, dtype=int)
+
+    for step in range(int(round(t_max/dt)) + 1):
+        t = step*dt
+        gy = signal_fun(np.maximum(y, 0), 'faster_than_linear')
+        fx = x / (eps + np.sum(x, axis=1, keepdims=True))
+
+        d_state = np.empty_like(state)
+        d_state[0] = (-A_x*x + (B_x - x)*fx - x*(sum_not_I(x, axis=1) + D*w)) * active
+        d_state[1] = -A_y*y + (B_y - y)*(gy + go_signal(t, t_go, pauses)*drive_gain*x) - \
+            (C_y + y)*sum_not_I(gy, axis=1)
+        d_state[2] = -A_w*w + (B_w - w)*np.maximum(y - gamma, 0)
+        state += dt*d_state
+        x[~active] = 0
+
+        # Items whose RCF unit crosses the threshold are recalled (ties broken by activity)
+        rows, cols = np.nonzero(active & (y > gamma))
+        if len(rows) > 0:
+            sort = np.lexsort((-y[rows, cols], rows))
+            rows, cols = rows[sort], cols[sort]
+            pos = num_recalled[rows] + np.arange(len(rows)) - np.searchsorted(rows, rows)
+            order[rows, pos] = cols
+            onset[rows, pos] = t
+            num_recalled += np.bincount(rows, minlength=batch)
+            active[rows, cols] = False
+            x[rows, cols] = 0
+
+            if np.all(num_recalled == lengths):
+                break
+
+    correct = np.all((order == np.arange(N)) | ~items, axis=1) & (num_recalled == lengths)
+    incomplete = num_recalled < lengths
+    if np.any(incomplete):
+        warnings.warn(f'{np.count_nonzero(incomplete)} of {batch} lists were not fully recalled '
+                      f'by t_max={t_max} (see num_recalled)')
+    return {'list': np.repeat(np.arange(num_lists), trials),
+            'trial': np.tile(np.arange(trials), num_lists),
+            'length': lengths,
+            'order': order,
+            'onset': onset,
+            'num_recalled': num_recalled,
+            'correct': correct}
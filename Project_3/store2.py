@@ -0,0 +1,180 @@
+'''store2.py
+STORE2 working memory model (Bradski et al., 1994) of item and order storage
+CS443: Computational Neuroscience
+YOUR NAMES HERE
+Project 3: Competitive Networks
+'''
+import numpy as np
+
+from competitive_nets import integrate, ADAPTIVE_METHODS, STIFF_METHODS
+from serial_recall import load_primacy_gradients
+
+
+def input_interval(x, y, I, A, B, dur):
+    '''Advances the x layer of STORE2 over an interval where the inputs `I` are on and constant.
+
+    With the inputs on, y is constant and
+        dx_i/dt = I_tot*(b_i - (X + B)*x_i),  b_i = A*I_i + y_i,  X = sum_i x_i.
+    Summing over i gives a Riccati equation for X, dX/dt = I_tot*(c - B*X - X**2) with
+    c = sum_i b_i, which has the closed form solution
+        X(t) = (r+ - r-*u(t)) / (1 - u(t)),  u(t) = u(0)*exp(-(r+ - r-)*tau),  tau = I_tot*t
+    where r+ > 0 > r- are the roots of X**2 + B*X - c. Then z_i = x_i - (b_i/c)*X follows
+    dz_i/dt = -I_tot*(X + B)*z_i, so
+        x_i(t) = (b_i/c)*X(t) + (x_i(0) - (b_i/c)*X(0))*phi(t),
+        phi(t) = exp(-integral of I_tot*(X + B)) = (1 - u(0))*exp(r-*tau) / (1 - u(t)).
+
+    Parameters:
+    -----------
+    x: ndarray. shape=(batch, N). Working memory activations at the start of the interval.
+    y: ndarray. shape=(batch, N). Second layer activations (constant during the interval).
+    I: ndarray. shape=(batch, N). Inputs (at least one > 0 per row).
+    A, B, dur: ndarrays. shape=(batch, 1). Input gain, decay rate and duration of the interval.
+
+    Returns:
+    -----------
+    ndarray. shape=(batch, N). x at the end of the interval.
+    '''
+    I_tot = np.sum(I, axis=1, keepdims=True)
+    b = A*I + y
+    c = np.sum(b, axis=1, keepdims=True)
+    X0 = np.sum(x, axis=1, keepdims=True)
+
+    sqrt_disc = np.sqrt(B**2 + 4*c)
+    r_plus, r_minus = (-B + sqrt_disc)/2, (-B - sqrt_disc)/2
+    tau = I_tot*dur
+    u0 = (X0 - r_plus) / (X0 - r_minus)
+    u = u0*np.exp(-sqrt_disc*tau)
+    X = (r_plus - r_minus*u) / (1 - u)
+    phi = (1 - u0)*np.exp(r_minus*tau) / (1 - u)
+
+    ratio = np.divide(b, c, out=np.zeros_like(b), where=c > 0)
+    return ratio*X + (x - ratio*X0)*phi
+
+
+def gap_interval(x, y, E, dur):
+    '''Advances the y layer of STORE2 over an interval where all the inputs are off.
+
+    With the inputs off, x is constant and dy_i/dt = E*(x_i - y_i), so
+        y_i(t) = x_i + (y_i(0) - x_i)*exp(-E*t).
+
+    Parameters:
+    -----------
+    x: ndarray. shape=(batch, N). Working memory activations (constant during the interval).
+    y: ndarray. shape=(batch, N). Second layer activations at the start of the interval.
+    E, dur: ndarrays. shape=(batch, 1). Rate of y and duration of the interval.
+
+    Returns:
+    -----------
+    ndarray. shape=(batch, N). y at the end of the interval.
+    '''
+    return x + (y - x)*np.exp(-E*dur)
+
+
+def _input_interval_ivp(x, y, I, A, B, dur, method, rtol, atol):
+    '''`input_interval` with a numerical ODE solver (see `competitive_nets.integrate`).
+    Time is rescaled to [0, 1] so that rows with different durations are solved together.
+    '''
+    I_tot = np.sum(I, axis=1, keepdims=True)
+
+    def rhs(t, x):
+        return dur*I_tot*(A*I + y - (np.sum(x, axis=1, keepdims=True) + B)*x)
+
+    return integrate(rhs, x, 1.0, 1.0, record='final', method=method, rtol=rtol, atol=atol)[-1]
+
+
+def store2(lengths, A=0.05, B=0.1, E=1.0, a=0.3, b=0.5, method='analytic', rtol=1e-8, atol=1e-12,
+           targets=None, return_events=False):
+    '''Simulates STORE2 storing lists of items, many lists and parameter settings at once.
+
+    Item j of a list (j = 1, 2, ...) is presented with magnitude 1 to working memory cell j
+    for `a` time units starting at (j-1)*(`a`+`b`), and is followed by a gap of `b` time units
+    where all the inputs are off:
+        dx_i/dt = I*(A*I_i + y_i - X*x_i - B*x_i)
+        dy_i/dt = E*(x_i - y_i)*(1 - I)
+    where I = sum_i I_i and X = sum_i x_i. The inputs are constant between these events, so the
+    simulation jumps from event to event with the closed form solution of each interval
+    (`input_interval`, `gap_interval`) instead of taking small time steps.
+
+    The default parameters store primacy gradients for lists of 1-10 items that are within about
+    0.02 (normalized) of primacy_gradients.csv.
+
+    Parameters:
+    -----------
+    lengths: int or array-like of ints. shape=(batch,). Number of items in each list.
+    A, B, E, a, b: floats or array-likes shape=(batch,). Parameters of each list (see above).
+        Scalars are shared by every list.
+    method: str. How the input intervals are integrated. 'analytic' uses the closed form solution.
+        Any adaptive or stiff method of `competitive_nets.integrate` (e.g. 'RK45', 'Radau') solves
+        them numerically instead (the gaps are always solved exactly).
+    rtol, atol: floats. Error tolerances of the numerical methods.
+    targets: list of ndarrays or None. Target gradients to compare against, where the gradient
+        with n items is the one of length n. None loads primacy_gradients.csv.
+    return_events: boolean. Also return x and y at every input event.
+
+    Returns:
+    -----------
+    dict of ndarrays. One row per list, with the columns
+        'length', 'A', 'B', 'E', 'a', 'b',
+        'x': shape=(batch, N_max). Stored gradient: x after the final gap (0 past the list end),
+        'y': shape=(batch, N_max). y after the final gap,
+        'primacy': whether the stored gradient strictly decreases with serial position,
+        'target_error': max absolute difference between the stored and target gradients, both
+            normalized to sum to 1 (NaN when there is no target with the list length).
+    ndarrays. Only if `return_events` is True. shape=(2*N_max + 1, batch, N_max).
+        x and y at t = 0 and at the end of each input and each gap interval. Lists that are
+        already stored keep their final values.
+    '''
+    lengths = np.atleast_1d(lengths)
+    batch, N = len(lengths), int(np.max(lengths))
+    A, B, E, a, b = [np.broadcast_to(np.asarray(p, dtype=float), (batch,))[:, np.newaxis]
+                     for p in (A, B, E, a, b)]
+    if method != 'analytic' and method not in ADAPTIVE_METHODS + STIFF_METHODS:
+        raise ValueError(f'Unknown method {method}. Options are analytic, '
+                         f'{", ".join(ADAPTIVE_METHODS + STIFF_METHODS)}')
+
+    x = np.zeros((batch, N))
+    y = np.zeros((batch, N))
+    x_events, y_events = [x.copy()], [y.copy()]
+    for k in range(N):
+        # Rows whose list has a k-th item: present it, then the gap
+        rows = lengths > k
+        I = np.zeros((np.count_nonzero(rows), N))
+        I[:, k] = 1
+        if method == 'analytic':
+            x[rows] = input_interval(x[rows], y[rows], I, A[rows], B[rows], a[rows])
+        else:
+            x[rows] = _input_interval_ivp(x[rows], y[rows], I, A[rows], B[rows], a[rows], method,
+                                          rtol, atol)
+        x_events.append(x.copy())
+        y_events.append(y.copy())
+
+        y[rows] = gap_interval(x[rows], y[rows], E[rows], b[rows])
+        x_events.append(x.copy())
+        y_events.append(y.copy())
+
+    positions = np.arange(N)
+    in_list = positions < lengths[:, np.newaxis]
+    primacy = np.all((x[:, :-1] > x[:, 1:]) | ~in_list[:, 1:], axis=1)
+
+    if targets is None:
+        targets = load_primacy_gradients()
+    targets = {len(g): np.asarray(g, dtype=float) / np.sum(g) for g in targets}
+    target_error = np.full(batch, np.nan)
+    norm_x = x / np.sum(x, axis=1, keepdims=True)
+    for n in np.intersect1d(np.unique(lengths), list(targets)):
+        rows = lengths == n
+        target_error[rows] = np.max(np.abs(norm_x[rows, :n] - targets[n]), axis=1)
+
+    table = {'length': lengths,
+             'A': A[:, 0],
+             'B': B[:, 0],
+             'E': E[:, 0],
+             'a': a[:, 0],
+             'b': b[:, 0],
+             'x': x,
+             'y': y,
+             'primacy': primacy,
+             'target_error': target_error}
+    if return_events:
+        return table, np.array(x_events), np.array(y_events)
+    return table
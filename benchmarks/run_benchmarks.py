@@ -0,0 +1,267 @@
+'''run_benchmarks.py
+Benchmarks of the Hopfield network, preprocessing and competitive network hot paths
+CS443: Computational Neuroscience
+YOUR NAMES HERE
+
+Every case runs in its own process (nothing is plotted), so that its peak resident memory is
+measured on its own. The wall time of each case is the best of `--repeat` runs (setup such as
+building the network or the data is not timed).
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py                    # writes benchmarks/results.json
+    python benchmarks/run_benchmarks.py --quick            # skip the M = 16384 cases
+    python benchmarks/run_benchmarks.py --filter hopfield  # only the cases whose name matches
+    python benchmarks/run_benchmarks.py --out benchmarks/baseline.json   # store a baseline
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+        # flags the cases that got slower (or use more memory) than the baseline by > --threshold
+
+The results depend on the machine, so baselines are not committed.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(ROOT, 'Project_2'))
+sys.path.insert(0, os.path.join(ROOT, 'Project_3'))
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import numpy as np
+
+HOPFIELD_SIZES = (63, 4096, 16384)
+# Euler time steps of each network size. The larger networks need smaller steps to stay stable
+# (lateral inhibition and the RCF with N = 1000 blow up with dt = 0.01)
+SIM_DTS = {10: (0.01, 0.001), 1000: (0.001, 0.0001)}
+IMAGE_DTS = (0.01, 0.001)
+
+
+def load_digits():
+    '''The 10 digits of data/digits.txt as bipolar vectors. shape=(10, 63).'''
+    with open(os.path.join(ROOT, 'Project_2', 'data', 'digits.txt')) as f:
+        rows = [line.strip() for line in f if line.strip()]
+    bits = np.array([[int(c) for c in row] for row in rows])
+    return 2*bits.reshape(10, -1) - 1
+
+
+def hopfield_data(M, rng):
+    '''Stored patterns and noisy probes of them with M neurons. The digits when M = 63.'''
+    if M == 63:
+        data = load_digits()
+    else:
+        data = rng.choice([-1, 1], size=(max(4, M // 512), M))
+    probes = data.copy()
+    flips = rng.random(probes.shape) < 0.1
+    probes[flips] *= -1
+    return data, probes
+
+
+def hopfield_case(kind, M):
+    from hopfield import HopfieldNet
+    rng = np.random.default_rng(0)
+    np.random.seed(0)
+    data, probes = hopfield_data(M, rng)
+    side = int(np.sqrt(M))
+    width, height = (9, 7) if M == 63 else (side, M // side)
+
+    if kind == 'initialize_wts':
+        net = HopfieldNet(data, width, height, storage='implicit', dtype=np.float32)
+
+        def run():
+            net.initialize_wts(data)
+            return {}
+        return run
+
+    net = HopfieldNet(data, width, height, storage='dense', dtype=np.float32)
+    if kind == 'energy':
+        def run():
+            net.energy(probes)
+            return {}
+        return run
+
+    def run():
+        np.random.seed(0)
+        net.predict(probes, batch=True, schedule='permutation')
+        # Time steps until the slowest probe of the batch was done
+        return {'steps': int(np.max(net.recall_stats['iters']))}
+    return run
+
+
+def preprocessing_case(kind):
+    import preprocessing
+    rng = np.random.default_rng(0)
+
+    if kind == 'resize_imgs':
+        from PIL import Image
+        imgs = [Image.fromarray(rng.integers(0, 256, size=(256, 256, 3), dtype=np.uint8))
+                for _ in range(64)]
+
+        def run():
+            preprocessing.resize_imgs(imgs, 64, 64)
+            return {}
+        return run
+
+    if kind == 'img2binaryvectors':
+        imgs = rng.integers(0, 256, size=(1024, 64, 64)).astype(float)
+
+        def run():
+            preprocessing.img2binaryvectors(imgs, dtype=np.int8)
+            return {}
+        return run
+
+    orig = rng.choice(np.array([-1, 1], dtype=np.int8), size=(1024, 4096))
+    recovered = orig.copy()
+    recovered[rng.random(orig.shape) < 0.05] *= -1
+
+    def run():
+        preprocessing.recall_error(orig, recovered)
+        return {}
+    return run
+
+
+def competitive_case(sim, N, dt):
+    import competitive_nets
+    rng = np.random.default_rng(0)
+    kwargs = {'t_max': 10, 'dt': dt, 'record': 'final', 'mode': 'early_stop', 'return_info': True}
+    if sim == 'dist_dep_net_image':
+        I = rng.random((N, N))
+        args = (I, 1, 2, 9)
+    elif sim == 'dist_dep_net':
+        I = rng.random(N)
+        args = (I, 1, 1, 0, 1, 3, 15)
+    elif sim == 'rcf':
+        I = rng.random(N)
+        args = (I, 1, 3, 'faster_than_linear')
+    else:
+        I = rng.random(N)
+        args = (I, 1, 1)
+    fun = getattr(competitive_nets, sim)
+
+    def run():
+        competitive_nets._drive_cache.clear()
+        x, info = fun(*args, **kwargs)
+        if not np.all(np.isfinite(x)):
+            # A diverged simulation never meets the early stopping criterion and is not a timing
+            raise FloatingPointError(f'{sim} with N={N}, dt={dt} diverged')
+        return {'steps': info['n_steps']}
+    return run
+
+
+def all_cases(quick=False):
+    '''Names of the benchmark cases and (function, args) to set each one up.'''
+    cases = {}
+    for M in HOPFIELD_SIZES:
+        if quick and M > 4096:
+            continue
+        for kind in ('initialize_wts', 'energy', 'predict'):
+            cases[f'hopfield.{kind}[M={M}]'] = (hopfield_case, (kind, M))
+    for kind in ('resize_imgs', 'img2binaryvectors', 'recall_error'):
+        cases[f'preprocessing.{kind}'] = (preprocessing_case, (kind,))
+    for sim in ('leaky_integrator', 'lateral_inhibition', 'dist_dep_net', 'rcf'):
+        for N, dts in SIM_DTS.items():
+            for dt in dts:
+                cases[f'competitive_nets.{sim}[N={N},dt={dt}]'] = (competitive_case, (sim, N, dt))
+    for dt in IMAGE_DTS:
+        cases[f'competitive_nets.dist_dep_net_image[N=128x128,dt={dt}]'] = \
+            (competitive_case, ('dist_dep_net_image', 128, dt))
+    return cases
+
+
+def peak_rss_mb():
+    '''Peak resident memory of this process in MB (ru_maxrss is in KB on Linux, bytes on macOS).'''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def run_case(name, repeat):
+    '''Runs one case in the current process and prints its results as JSON.'''
+    setup, args = all_cases()[name]
+    run = setup(*args)
+    walls = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        metrics = run()
+        walls.append(time.perf_counter() - start)
+    print(json.dumps({'wall': min(walls), 'peak_rss_mb': peak_rss_mb(), **metrics}))
+
+
+def compare(results, baseline, threshold, min_wall=0.005, min_rss_mb=10):
+    '''Compares results against a baseline. Returns the list of regression messages.'''
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None or 'error' in base:
+            continue
+        if 'error' in res:
+            # Passed in the baseline but crashes (or diverges) now
+            regressions.append(f'{name}: failed: {res["error"]}')
+            continue
+        if res['wall'] > threshold*base['wall'] and res['wall'] - base['wall'] > min_wall:
+            regressions.append(f'{name}: wall {base["wall"]:.4f}s -> {res["wall"]:.4f}s')
+        if res['peak_rss_mb'] > threshold*base['peak_rss_mb'] and \
+                res['peak_rss_mb'] - base['peak_rss_mb'] > min_rss_mb:
+            regressions.append(f'{name}: peak RSS {base["peak_rss_mb"]:.0f}MB -> '
+                               f'{res["peak_rss_mb"]:.0f}MB')
+        if 'steps' in base and res.get('steps', 0) > base['steps']:
+            regressions.append(f'{name}: steps {base["steps"]} -> {res["steps"]}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--filter', default='', help='only run the cases whose name contains this')
+    parser.add_argument('--quick', action='store_true', help='skip the largest Hopfield networks')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case (best one is kept)')
+    parser.add_argument('--out', default=os.path.join(HERE, 'results.json'))
+    parser.add_argument('--baseline', default=None, help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='flag cases slower (or bigger) than threshold*baseline')
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        run_case(args.case, args.repeat)
+        return 0
+
+    results = {}
+    for name in all_cases(args.quick):
+        if args.filter not in name:
+            continue
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', name,
+                               '--repeat', str(args.repeat)], capture_output=True, text=True)
+        if proc.returncode != 0:
+            results[name] = {'error': proc.stderr.strip().splitlines()[-1]}
+            print(f'{name:<55} FAILED: {results[name]["error"]}')
+            continue
+        results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+        steps = results[name].get('steps', '')
+        print(f'{name:<55} {results[name]["wall"]:>9.4f}s {results[name]["peak_rss_mb"]:>8.0f}MB '
+              f'{steps:>8}')
+
+    meta = {'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+    with open(args.out, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2)
+    print(f'Results written to {args.out}')
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for msg in regressions:
+            print('REGRESSION', msg)
+        if regressions:
+            return 1
+        print(f'No regressions against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())